@@ -0,0 +1,175 @@
+"""Headless batch runner: simulate every agenda file in a directory and stream results as JSONL.
+
+Each agenda file gets its own FocusGroupSimulator. All simulators share one LLMClient, so the
+per-key RPM/TPM buckets act as a single global rate-limit budget across the worker pool.
+
+Usage:
+    python batch_runner.py AGENDA_DIR [--personas personas] [--output results.jsonl]
+                           [--workers 4] [--rounds 1] [--duration 600] [--analysis] [--resume]
+                           [--journal-dir journals] [--seed 0] [--rpm-limit 15] [--tpm-limit 1000000]
+
+With --journal-dir every file checkpoints its scores, memories and turns to
+<journal-dir>/<file name>.jsonl; combined with --resume, a file whose run was interrupted
+continues from its journal instead of starting over.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from main import APIKeyPool, FocusGroupSimulator, LLMClient, PacingPolicy, SimulationJournal, create_provider
+
+logger = logging.getLogger(__name__)
+
+AGENDA_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+
+def find_agenda_files(agenda_dir: str):
+    return sorted(
+        os.path.join(agenda_dir, name) for name in os.listdir(agenda_dir)
+        if name.lower().endswith(AGENDA_EXTENSIONS)
+    )
+
+
+def completed_files(output_path: str) -> set:
+    """Files that already have a successful record in the output (for --resume)"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('status') == 'ok':
+                done.add(record.get('file'))
+    return done
+
+
+async def run_file(file_path: str, llm_client: LLMClient, args) -> dict:
+    """Run preparation + discussion (+ optional analysis) for one agenda file"""
+    started = time.perf_counter()
+    record = {'file': file_path, 'started_at': datetime.now().isoformat(timespec='seconds')}
+    simulator = FocusGroupSimulator(llm_client=llm_client, pacing=PacingPolicy(), persona_dir=args.personas,
+                                    seed=args.seed)
+    simulator.preparation_mode = args.preparation_mode
+    try:
+        if not simulator.personas:
+            raise ValueError(f"No personas found in {args.personas}")
+        journal_path = None
+        if args.journal_dir:
+            journal_path = os.path.join(args.journal_dir, os.path.basename(file_path) + '.jsonl')
+        if (args.resume and journal_path and os.path.exists(journal_path)
+                and not SimulationJournal.is_finished(journal_path)):
+            if not simulator.resume_from_journal(journal_path):
+                raise ValueError(f"Journal could not be resumed: {journal_path}")
+            record['resumed'] = True
+        else:
+            if not simulator.load_agenda_data(file_path):
+                raise ValueError("Agenda file could not be loaded")
+            if journal_path:
+                simulator.open_journal(journal_path)
+        await simulator.prepare_agenda_analysis()
+        await simulator.start_simulation(max_rounds=args.rounds, duration_seconds=args.duration)
+        record['status'] = 'ok'
+        record['personas'] = [persona.name for persona in simulator.personas]
+        record['agenda_items'] = [
+            {
+                'title': item.title,
+                'score': item.score,
+                'persona_scores': item.persona_scores,
+                'persona_memories': item.persona_memories,
+            }
+            for item in simulator.agenda_items
+        ]
+        record['discussion'] = [
+            {'timestamp': entry['timestamp'].isoformat(), 'speaker': entry['speaker'], 'message': entry['message']}
+            for entry in simulator.discussion_log
+        ]
+        if args.analysis:
+            record['analysis'] = await simulator.generate_analysis()
+    except Exception as e:
+        logger.error(f"Batch run failed for {file_path}: {e}")
+        simulator.stop_simulation()
+        record['status'] = 'error'
+        record['error'] = str(e)
+    finally:
+        simulator.close_journal()
+    record['duration'] = round(time.perf_counter() - started, 2)
+    return record
+
+
+async def run_batch(args):
+    files = find_agenda_files(args.agenda_dir)
+    if args.resume:
+        done = completed_files(args.output)
+        files = [file_path for file_path in files if file_path not in done]
+    if not files:
+        logger.info("Nothing to run")
+        return
+
+    llm_client = LLMClient(provider=create_provider(args.provider) if args.provider else None)
+    if args.rpm_limit or args.tpm_limit:
+        llm_client.key_pool = APIKeyPool(
+            llm_client.api_keys,
+            rpm_limit=args.rpm_limit or llm_client.provider.default_rpm_limit,
+            tpm_limit=args.tpm_limit or llm_client.provider.default_tpm_limit
+        )
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for file_path in files:
+        queue.put_nowait(file_path)
+    write_lock = asyncio.Lock()
+    counts = {'ok': 0, 'error': 0}
+
+    with open(args.output, 'a', encoding='utf-8') as output:
+        async def worker():
+            while True:
+                try:
+                    file_path = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                record = await run_file(file_path, llm_client, args)
+                counts[record['status']] += 1
+                async with write_lock:
+                    output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                    output.flush()
+                logger.info(f"[{counts['ok'] + counts['error']}/{len(files)}] {file_path}: {record['status']} "
+                            f"({record['duration']} s)")
+
+        await asyncio.gather(*(worker() for _ in range(min(args.workers, len(files)))))
+
+    stats = llm_client.get_request_stats()
+    logger.info(f"Batch finished: {counts['ok']} ok, {counts['error']} failed, "
+                f"{llm_client.request_count} LLM requests, success rate {stats['success_rate']:.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run focus group simulations for a directory of agenda files")
+    parser.add_argument('agenda_dir', help="directory containing agenda CSV/XLSX files")
+    parser.add_argument('--personas', default='personas', help="directory of persona JSON files")
+    parser.add_argument('--output', default='batch_results.jsonl', help="JSONL file results are appended to")
+    parser.add_argument('--workers', type=int, default=4, help="agenda files simulated concurrently")
+    parser.add_argument('--rounds', type=int, default=1, help="rounds per file (upper bound with --duration)")
+    parser.add_argument('--duration', type=float, default=None,
+                        help="discussion time budget per file in seconds; items/rounds/speakers are planned to fit")
+    parser.add_argument('--preparation-mode', default='fused', choices=('fused', 'batch', 'separate'))
+    parser.add_argument('--analysis', action='store_true', help="also generate the overseer analysis per file")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip files that already succeeded in --output and continue interrupted journals")
+    parser.add_argument('--journal-dir', default=None, help="directory for per-file checkpoint journals")
+    parser.add_argument('--provider', default=None, help="LLM provider (defaults to LLM_PROVIDER)")
+    parser.add_argument('--seed', type=int, default=None, help="seed every simulator (defaults to SIMULATION_SEED)")
+    parser.add_argument('--rpm-limit', type=int, default=None, help="per-key requests/minute shared by all workers")
+    parser.add_argument('--tpm-limit', type=int, default=None, help="per-key tokens/minute shared by all workers")
+    args = parser.parse_args()
+
+    asyncio.run(run_batch(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Micro-benchmarks for the LLM client internals and the offline simulation pipeline.
+
+Usage:
+    python benchmark.py model-cache [--iterations 500]
+    python benchmark.py simulation [--items 10] [--rounds 1] [--latency 0.05] [--seed 0]
+                                   [--record rec.jsonl | --replay rec.jsonl [--replay-latency-scale 1]]
+
+The simulation workload is seeded, so two runs print the same transcript digest. --record saves
+every reply; --replay re-runs that recording offline, byte-identical, as a fixed workload.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+from main import (AgendaItem, FakeProvider, FocusGroupSimulator, GeminiProvider, LLMClient, PacingPolicy,
+                  RecordingProvider, ReplayProvider)
+
+
+def bench_model_cache(iterations: int):
+    """Per-call setup cost: configure + new model/config (old path) vs cached model lookup"""
+    client = LLMClient(provider=GeminiProvider(), cache_mode='bypass')
+    provider = client.provider
+    api_key = client.api_key or os.getenv('GEMINI_API_KEY') or 'benchmark-dummy-key'
+    config = client.generation_config
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(client.model_name)
+        genai.types.GenerationConfig(**config)
+        # generate_content eskiden her yeni model için varsayılan istemciyi yeniden kuruyordu
+        # (özel _client alanı; google-generativeai 0.8.x, bkz. GeminiProvider._get_model)
+        model._client = genai_client.get_default_generative_client()
+    uncached = (time.perf_counter() - start) / iterations
+
+    provider._get_model(api_key, client.model_name, config)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        provider._get_model(api_key, client.model_name, config)
+    cached = (time.perf_counter() - start) / iterations
+
+    print(f"iterations:          {iterations}")
+    print(f"per-call (uncached): {uncached * 1e6:10.1f} µs")
+    print(f"per-call (cached):   {cached * 1e6:10.1f} µs")
+    print(f"saved per call:      {(uncached - cached) * 1e6:10.1f} µs ({uncached / cached:.0f}x)")
+
+
+async def bench_simulation(items: int, rounds: int, latency: float, seed: int = 0, record: str = None,
+                           replay: str = None, replay_latency_scale: float = 0.0):
+    """Run preparation + discussion end to end against the fake provider (or a replayed recording)"""
+    if replay:
+        provider = ReplayProvider(replay, latency_scale=replay_latency_scale)
+    else:
+        provider = FakeProvider(latency_median=latency, seed=0)
+        if record:
+            provider = RecordingProvider(provider, record)
+    simulator = FocusGroupSimulator(llm_client=LLMClient(provider=provider, cache_mode='bypass'),
+                                    pacing=PacingPolicy(), seed=seed)
+    call_count = lambda: len(simulator.llm_client.call_records)
+    simulator.agenda_items = [
+        AgendaItem(type='haber', link='', title=f"Gündem maddesi {index}",
+                   content="Ekonomi, eğitim ve adalet üzerine uzun bir haber metni. " * 20, comments="Yorumlar")
+        for index in range(1, items + 1)
+    ]
+
+    start = time.perf_counter()
+    await simulator.prepare_agenda_analysis()
+    preparation = time.perf_counter() - start
+    preparation_calls = call_count()
+
+    start = time.perf_counter()
+    await simulator.start_simulation(max_rounds=rounds)
+    discussion = time.perf_counter() - start
+
+    print(f"agenda items:        {items} x {len(simulator.personas)} personas")
+    print(f"preparation:         {preparation:8.2f} s, {preparation_calls} LLM calls")
+    print(f"discussion:          {discussion:8.2f} s, {call_count() - preparation_calls} LLM calls, "
+          f"{len(simulator.discussion_log)} messages")
+    transcript = json.dumps([(entry['speaker'], entry['message']) for entry in simulator.discussion_log],
+                            ensure_ascii=False)
+    print(f"transcript digest:   {hashlib.sha256(transcript.encode('utf-8')).hexdigest()[:16]}")
+    if replay:
+        print(f"replay misses:       {provider.misses}")
+    for call_type, values in simulator.llm_client.get_latency_stats().items():
+        print(f"  {call_type:<13} calls={values['calls']:<4} p50={values['p50']:.3f}s p95={values['p95']:.3f}s "
+              f"p99={values['p99']:.3f}s queue={values['mean_queue_wait']:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM client micro-benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    model_cache = subparsers.add_parser('model-cache', help="model/client cache vs per-call setup")
+    model_cache.add_argument('--iterations', type=int, default=500)
+    simulation = subparsers.add_parser('simulation', help="full simulator pipeline on the fake provider")
+    simulation.add_argument('--items', type=int, default=10)
+    simulation.add_argument('--rounds', type=int, default=1)
+    simulation.add_argument('--latency', type=float, default=0.05, help="median fake LLM latency in seconds")
+    simulation.add_argument('--seed', type=int, default=0, help="simulator seed (speaker order, closings)")
+    simulation.add_argument('--record', default=None, help="write every LLM reply to this JSONL recording")
+    simulation.add_argument('--replay', default=None, help="serve LLM replies from a recording instead")
+    simulation.add_argument('--replay-latency-scale', type=float, default=0.0,
+                            help="sleep recorded latency x scale per replayed call (0 = no delay)")
+    args = parser.parse_args()
+
+    if args.command == 'model-cache':
+        bench_model_cache(args.iterations)
+    elif args.command == 'simulation':
+        asyncio.run(bench_simulation(args.items, args.rounds, args.latency, args.seed, args.record,
+                                     args.replay, args.replay_latency_scale))
+
+
+if __name__ == '__main__':
+    main()
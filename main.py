@@ -2,15 +2,24 @@ import asyncio
 import json
 import logging
 import os
-from datetime import datetime
-from typing import Dict, List, Optional, Callable
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Callable, Tuple
 import pandas as pd
 import numpy as np
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from collections import deque
 import google.generativeai as genai
+import google.ai.generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 import re
 import time
+import hashlib
+import random
+from email.utils import parsedate_to_datetime
+import sqlite3
+import threading
+from concurrent.futures import Future
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +29,28 @@ load_dotenv()
 
 mcp_logs = []
 
+@dataclass
+class PromptBlock:
+    text: str
+    tokens: int
+
+# Her prompt türü için persona profilinden hangi alanların gönderileceği
+PERSONA_RENDER_FIELDS = {
+    'scoring': ('role', 'personality', 'bio', 'lore', 'knowledge', 'topics', 'adjectives'),
+    'memory': ('role', 'personality', 'bio', 'knowledge', 'topics', 'adjectives'),
+    'dialogue': ('bio', 'lore', 'knowledge', 'topics', 'style', 'adjectives'),
+}
+PERSONA_FIELD_LABELS = {
+    'role': 'Rol', 'personality': 'Kişilik', 'bio': 'Biyo', 'lore': 'Geçmiş',
+    'knowledge': 'Bilgi', 'topics': 'Konular', 'style': 'Stil', 'adjectives': 'Sıfatlar',
+}
+# Diyalogda 'post' (sosyal medya paylaşımı) stili kullanılmaz
+PERSONA_STYLE_LABELS = {'all': 'genel', 'chat': 'sohbet'}
+PERSONA_INLINE_FIELDS = ('topics', 'adjectives')
+
+# Dosya yolu -> (mtime, renderings); aynı JSON tekrar yüklendiğinde yeniden derlenmez
+_persona_render_cache: Dict[str, tuple] = {}
+
 @dataclass
 class Persona:
     name: str
@@ -34,6 +65,54 @@ class Persona:
     profile_pic: str = None
     role: str = None
     personality: str = None
+    source_path: str = None
+    source_mtime: float = None
+    renderings: Dict[str, PromptBlock] = field(default=None, repr=False, compare=False)
+
+    @staticmethod
+    def _render_field(key: str, value) -> str:
+        label = PERSONA_FIELD_LABELS[key]
+        if not value:
+            return ""
+        if key == 'style' and isinstance(value, dict):
+            lines = [
+                f"{label} ({style_label}): {', '.join(str(v).strip() for v in value.get(style_key) or [])}"
+                for style_key, style_label in PERSONA_STYLE_LABELS.items() if value.get(style_key)
+            ]
+            return "\n".join(lines)
+        if isinstance(value, list):
+            items = [str(v).strip().rstrip('.,;') for v in value if str(v).strip()]
+            if key in PERSONA_INLINE_FIELDS:
+                return f"{label}: {', '.join(items)}"
+            return f"{label}:\n" + "\n".join(f"- {v}" for v in items)
+        return f"{label}: {str(value).strip()}"
+
+    def compile_renderings(self) -> Dict[str, PromptBlock]:
+        """Puanlama, hafıza ve diyalog promptları için kompakt profil metinlerini bir kez üret"""
+        renderings = {}
+        for kind, keys in PERSONA_RENDER_FIELDS.items():
+            parts = [f"İsim: {self.name}"] + [self._render_field(key, getattr(self, key)) for key in keys]
+            text = "\n".join(part for part in parts if part)
+            renderings[kind] = PromptBlock(text=text, tokens=estimate_tokens(text))
+        self.renderings = renderings
+        if self.source_path:
+            _persona_render_cache[self.source_path] = (self.source_mtime, renderings)
+        return renderings
+
+    def render(self, kind: str) -> PromptBlock:
+        """Derlenmiş profil metnini döndür; JSON dosyası değiştiyse persona yeniden yüklenir"""
+        if self.source_path and os.path.exists(self.source_path):
+            mtime = os.path.getmtime(self.source_path)
+            if mtime != self.source_mtime:
+                logger.info(f"Persona dosyası değişti, yeniden yükleniyor: {self.source_path}")
+                fresh = Persona.from_json(self.source_path)
+                for name in ('name', 'bio', 'lore', 'knowledge', 'topics', 'style', 'adjectives', 'role', 'personality'):
+                    setattr(self, name, getattr(fresh, name))
+                self.source_mtime = fresh.source_mtime
+                self.renderings = fresh.renderings
+        if self.renderings is None:
+            self.compile_renderings()
+        return self.renderings[kind]
 
     @classmethod
     def from_json(cls, json_file: str):
@@ -50,7 +129,9 @@ class Persona:
             profile_pic = pic_path_png
         else:
             profile_pic = None
-        return cls(
+        source_path = os.path.abspath(json_file)
+        source_mtime = os.path.getmtime(json_file)
+        persona = cls(
             name=name,
             bio=data.get('bio'),
             lore=data.get('lore'),
@@ -62,8 +143,16 @@ class Persona:
             clients=data.get('clients'),
             profile_pic=profile_pic,
             role=data.get('role', 'Katılımcı'),
-            personality=data.get('personality', 'Nötr')
+            personality=data.get('personality', 'Nötr'),
+            source_path=source_path,
+            source_mtime=source_mtime
         )
+        cached = _persona_render_cache.get(source_path)
+        if cached and cached[0] == source_mtime:
+            persona.renderings = cached[1]
+        else:
+            persona.compile_renderings()
+        return persona
 
 @dataclass
 class AgendaItem:
@@ -82,138 +171,1179 @@ class AgendaItem:
         if self.persona_memories is None:
             self.persona_memories = {}
 
-class LLMClient:
+# call_llm hata durumunda istisna yerine bu metinleri döndürür
+LLM_NO_KEY_MESSAGE = "API anahtarı bulunamadı. Lütfen .env dosyasını kontrol edin."
+LLM_UNAVAILABLE_MESSAGE = "Üzgünüm, şu anda yanıt veremiyorum."
+LLM_RETRY_LATER_MESSAGE = "Üzgünüm, şu anda yanıt veremiyorum. Lütfen daha sonra tekrar deneyin."
+LLM_FALLBACK_MESSAGES = (LLM_NO_KEY_MESSAGE, LLM_UNAVAILABLE_MESSAGE, LLM_RETRY_LATER_MESSAGE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token) used for rate limiting"""
+    return len(text) // 4 + 1
+
+
+# Prompt türü başına bölümlere ayrılan toplam token bütçesi (sabit talimat metni hariç)
+PROMPT_TOKEN_BUDGETS = {
+    'score': 4000,
+    'memory': 4000,
+    'score_memory': 4000,
+    'batch_item': 500,
+    'turn': 6000,
+    'moderator': 800,
+    'analysis': 48000,
+    'context': 1500,
+}
+TRUNCATION_MARK = "[...]"
+
+
+@dataclass
+class PromptSection:
+    """Bir prompt bölümü; bütçe aşılınca priority değeri düşük olanlar önce kısaltılır
+
+    keep: kısaltmada korunacak kısım ('head' baş, 'tail' son, 'middle' baş ve son).
+    """
+    name: str
+    text: str
+    priority: int = 1
+    max_tokens: Optional[int] = None
+    min_tokens: int = 0
+    keep: str = 'head'
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = 'head') -> str:
+    """Metni yaklaşık max_tokens'a indir; mümkünse satır veya cümle sınırından keser"""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 1:
+        return ""
+    max_chars = (max_tokens - 1) * 4
+    if keep == 'middle':
+        head = truncate_to_tokens(text, max_tokens // 2, 'head')
+        tail = truncate_to_tokens(text, max_tokens // 2, 'tail')
+        return f"{head.removesuffix(TRUNCATION_MARK).rstrip()}\n{TRUNCATION_MARK}\n{tail.removeprefix(TRUNCATION_MARK).lstrip()}"
+    if keep == 'tail':
+        cut = text[-max_chars:]
+        boundary = cut.find('\n')
+        if 0 <= boundary < len(cut) // 2:
+            cut = cut[boundary + 1:]
+        return f"{TRUNCATION_MARK} {cut}"
+    cut = text[:max_chars]
+    boundary = max(cut.rfind('\n'), cut.rfind('. '))
+    if boundary > len(cut) // 2:
+        cut = cut[:boundary + 1]
+    return f"{cut.rstrip()} {TRUNCATION_MARK}"
+
+
+def fit_prompt_sections(kind: str, sections: List[PromptSection], token_budget: int = None) -> Dict[str, str]:
+    """Bölümleri önce kendi max_tokens sınırına, sonra prompt türünün toplam bütçesine sığdır
+
+    Toplam aşılırsa en düşük öncelikli bölümden başlayarak min_tokens'a kadar kısaltılır;
+    yapılan her kısaltma loglanır.
+    """
+    token_budget = token_budget or PROMPT_TOKEN_BUDGETS.get(kind)
+    texts, trimmed = {}, []
+    for section in sections:
+        text = section.text or ""
+        if section.max_tokens is not None and estimate_tokens(text) > section.max_tokens:
+            before = estimate_tokens(text)
+            text = truncate_to_tokens(text, section.max_tokens, section.keep)
+            trimmed.append(f"{section.name} {before}->{estimate_tokens(text)}")
+        texts[section.name] = text
+    
+    if token_budget:
+        overflow = sum(estimate_tokens(text) for text in texts.values() if text) - token_budget
+        for section in sorted(sections, key=lambda s: s.priority):
+            if overflow <= 0:
+                break
+            text = texts[section.name]
+            current = estimate_tokens(text) if text else 0
+            target = max(section.min_tokens, current - overflow)
+            if target >= current:
+                continue
+            texts[section.name] = truncate_to_tokens(text, target, section.keep)
+            remaining = estimate_tokens(texts[section.name]) if texts[section.name] else 0
+            overflow -= current - remaining
+            trimmed.append(f"{section.name} {current}->{remaining}" if remaining else f"{section.name} çıkarıldı ({current})")
+    
+    if trimmed:
+        logger.info(f"Prompt bütçesi ({kind}, {token_budget} token): {', '.join(trimmed)}")
+    return texts
+
+
+class TokenBucket:
+    """Token bucket that refills continuously up to its capacity over one period"""
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.refill_rate = self.capacity / period
+        self.last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Correct an earlier estimate; positive amounts consume, negative ones refund"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+def classify_error(error: Exception) -> str:
+    """Map an LLM error to 'rate_limit', 'auth', 'transient' or 'fatal'"""
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return 'rate_limit'
+    if isinstance(error, (google_exceptions.PermissionDenied, google_exceptions.Unauthenticated)):
+        return 'auth'
+    if isinstance(error, (google_exceptions.InvalidArgument, google_exceptions.NotFound, google_exceptions.FailedPrecondition)):
+        return 'fatal'
+    if "429" in str(error) or "quota" in str(error).lower():
+        return 'rate_limit'
+    return 'transient'
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """Sunucunun önerdiği bekleme süresini (saniye) bul: RetryInfo, Retry-After başlığı ya da hata metni"""
+    for detail in getattr(error, 'details', None) or []:
+        retry_delay = getattr(detail, 'retry_delay', None)
+        if retry_delay is not None:
+            seconds = getattr(retry_delay, 'seconds', 0) + getattr(retry_delay, 'nanos', 0) / 1e9
+            if seconds > 0:
+                return seconds
+    
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    header_value = headers.get('Retry-After') if headers else None
+    if header_value:
+        try:
+            return max(float(header_value), 0.0)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(header_value)
+                return max((retry_at - datetime.now(tz=retry_at.tzinfo)).total_seconds(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    
+    message = str(error)
+    match = (re.search(r'retry_delay\s*\{\s*seconds:\s*(\d+)', message)
+             or re.search(r'retry (?:in|after) ([\d.]+)\s*s', message, re.IGNORECASE))
+    return float(match.group(1)) if match else None
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter; a server-provided retry hint takes precedence"""
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0, multiplier: float = 2.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            # Sunucu ipucuna küçük bir pay eklenir ki tüm istemciler aynı anda dönmesin
+            return min(retry_after, self.max_delay) + random.uniform(0, self.base_delay)
+        cap = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        return cap / 2 + random.uniform(0, cap / 2)
+
+
+class CircuitBreaker:
+    """Per-key circuit breaker: opens after repeated failures or a rate limit, then lets one trial request through"""
+    def __init__(self, failure_threshold: int = 3, trial_timeout: float = 120.0):
+        self.failure_threshold = failure_threshold
+        self.trial_timeout = trial_timeout
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_started_at = None
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if not self.open_until:
+            return 'closed'
+        if time.monotonic() < self.open_until:
+            return 'open'
+        return 'half_open'
+
+    def wait_time(self) -> float:
+        """Seconds before this key may be used again (0 if usable now)"""
+        state = self.state
+        if state == 'open':
+            return self.open_until - time.monotonic()
+        if state == 'half_open' and self.trial_started_at is not None:
+            # Deneme isteği sürüyor; takılı kalmış bir deneme trial_timeout sonra yok sayılır
+            remaining = self.trial_started_at + self.trial_timeout - time.monotonic()
+            if remaining > 0:
+                return min(remaining, 1.0)
+        return 0.0
+
+    def on_acquire(self):
+        if self.state == 'half_open':
+            self.trial_started_at = time.monotonic()
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_started_at = None
+
+    def record_failure(self, cooldown: float, trip: bool = False):
+        self.consecutive_failures += 1
+        was_half_open = self.state == 'half_open'
+        self.trial_started_at = None
+        if trip or was_half_open or self.consecutive_failures >= self.failure_threshold:
+            self.open_until = max(self.open_until, time.monotonic() + cooldown)
+            self.trips += 1
+
+
+@dataclass
+class APIKeyState:
+    api_key: str
+    rpm_bucket: TokenBucket
+    tpm_bucket: TokenBucket
+    request_count: int = 0
+    breaker: CircuitBreaker = None
+
+    def __post_init__(self):
+        if self.breaker is None:
+            self.breaker = CircuitBreaker()
+
+    def wait_time(self, estimated_tokens: int) -> float:
+        return max(
+            self.breaker.wait_time(),
+            self.rpm_bucket.wait_time(1),
+            self.tpm_bucket.wait_time(estimated_tokens)
+        )
+
+
+class APIKeyPool:
+    """Gemini API anahtar havuzu; her anahtarın kendi RPM ve TPM kovası vardır"""
+    def __init__(self, api_keys: List[str], rpm_limit: int = 15, tpm_limit: int = 1_000_000):
+        self.keys = [
+            APIKeyState(api_key=key, rpm_bucket=TokenBucket(rpm_limit), tpm_bucket=TokenBucket(tpm_limit))
+            for key in api_keys
+        ]
+
+    @staticmethod
+    def discover_keys() -> List[str]:
+        """GEMINI_API_KEY ve GEMINI_API_KEY_* ortam değişkenlerindeki anahtarları topla"""
+        names = sorted(
+            (name for name in os.environ if name.startswith('GEMINI_API_KEY_')),
+            key=lambda name: [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+        )
+        keys = []
+        for name in ['GEMINI_API_KEY'] + names:
+            value = (os.getenv(name) or '').strip()
+            if value and value not in keys:
+                keys.append(value)
+        return keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    async def acquire(self, estimated_tokens: int) -> APIKeyState:
+        """Kapasitesi olan anahtarı döndür; hiçbiri uygun değilse en kısa süre kadar bekle"""
+        while True:
+            best_wait = None
+            available = []
+            for state in self.keys:
+                wait = state.wait_time(estimated_tokens)
+                if wait == 0:
+                    available.append(state)
+                elif best_wait is None or wait < best_wait:
+                    best_wait = wait
+            if available:
+                # En çok boş RPM kapasitesi olan anahtar seçilir, böylece yük anahtarlara yayılır
+                state = max(available, key=lambda s: s.rpm_bucket.tokens)
+                state.rpm_bucket.consume(1)
+                state.tpm_bucket.consume(estimated_tokens)
+                state.breaker.on_acquire()
+                state.request_count += 1
+                return state
+            logger.info(f"Tüm API anahtarları limitte, {best_wait:.1f} saniye bekleniyor")
+            await asyncio.sleep(best_wait)
+
+    def has_capacity(self, estimated_tokens: int, exclude: APIKeyState = None) -> bool:
+        """True if a key other than `exclude` could serve a request right now"""
+        return any(state is not exclude and state.wait_time(estimated_tokens) == 0 for state in self.keys)
+
+    def settle(self, state: APIKeyState, estimated_tokens: int, actual_tokens: int):
+        """Replace the token estimate with the usage reported by the API"""
+        state.tpm_bucket.adjust(actual_tokens - estimated_tokens)
+
+
+class LLMResponseCache:
+    """SQLite tabanlı, içerik adresli LLM yanıt önbelleği (TTL ve boyut sınırlı LRU)
+
+    Modlar: 'readwrite' okur ve yazar, 'readonly' sadece okur, 'bypass' önbelleği hiç kullanmaz.
+    """
+    MODES = ('readwrite', 'readonly', 'bypass')
+
+    def __init__(self, path: str = '.cache/llm_cache.sqlite3', ttl_seconds: float = 7 * 24 * 3600,
+                 max_entries: int = 5000, mode: str = 'readwrite'):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if mode != 'bypass':
+            self._connect()
+
+    def _connect(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"LLM cache could not be opened, caching disabled: {e}")
+            self._conn = None
+            self.mode = 'bypass'
+
+    @staticmethod
+    def make_key(prompt: str, model_name: str, generation_config: dict, provider: str = None) -> str:
+        fields = {'model': model_name, 'config': generation_config, 'prompt': prompt}
+        # Sağlayıcı adı anahtara girer; sahte sağlayıcının yanıtları gerçek çağrılara dönmez.
+        # Kayıt/oynatma anahtarları sağlayıcıdan bağımsız kalır (provider=None)
+        if provider:
+            fields['provider'] = provider
+        payload = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if self.mode == 'bypass':
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                if self.mode == 'readwrite':
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            if self.mode == 'readwrite':
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self.hits += 1
+            return response
+
+    def set(self, key: str, response: str):
+        if self.mode != 'readwrite':
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            self.writes += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Drop expired rows, then least recently used rows above max_entries"""
+        if self.ttl_seconds:
+            cursor = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.evictions += cursor.rowcount
+        overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)", (overflow,)
+            )
+            self.evictions += cursor.rowcount
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        entries = 0
+        if self._conn is not None:
+            with self._lock:
+                entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            'mode': self.mode,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups * 100) if lookups > 0 else 0,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'entries': entries
+        }
+
+
+@dataclass
+class TokenUsage:
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+
+
+@dataclass
+class LLMResult:
+    text: str
+    usage: TokenUsage = None
+
+
+class LLMProvider:
+    """Interface for the model backends behind LLMClient
+
+    generate() returns the full reply as an LLMResult; stream() is an async generator of
+    (text chunk, Optional[TokenUsage]) tuples. Errors should be raised as google.api_core
+    exceptions so the client's retry policy can classify them.
+    """
+    name = 'base'
+    default_rpm_limit = 15
+    default_tpm_limit = 1_000_000
+    # Kayıt/tekrar oynatma sağlayıcıları her çağrıyı görmeli; LLMClient bunlar için önbelleği kapatır
+    uses_cache = True
+
+    def default_api_keys(self) -> List[str]:
+        """Keys to use when none are configured; real backends have none"""
+        return []
+
+    async def generate(self, api_key: str, prompt: str, model_name: str, generation_config: dict) -> LLMResult:
+        raise NotImplementedError
+
+    async def stream(self, api_key: str, prompt: str, model_name: str, generation_config: dict):
+        result = await self.generate(api_key, prompt, model_name, generation_config)
+        yield result.text, result.usage
+
+
+class GeminiProvider(LLMProvider):
+    """google.generativeai backend with per-key service clients and cached model objects"""
+    name = 'gemini'
+
     def __init__(self):
-        self.api_key = os.getenv('GEMINI_API_KEY')
-        self.api_key_2 = os.getenv('GEMINI_API_KEY_2')
-        self.current_api_key = self.api_key
-        self.last_switch_time = time.time()
-        self.switch_interval = 30
-        self.retry_delay = 15
+        self._service_clients = {}
+        self._model_cache = {}
+
+    def _get_service_client(self, api_key: str):
+        """Anahtar başına tek bir GenerativeServiceClient (gRPC kanalı) oluştur ve sakla"""
+        service_client = self._service_clients.get(api_key)
+        if service_client is None:
+            service_client = glm.GenerativeServiceClient(client_options={'api_key': api_key})
+            self._service_clients[api_key] = service_client
+        return service_client
+
+    def _get_model(self, api_key: str, model_name: str, generation_config: dict):
+        """Return a cached GenerativeModel for (api key, model name, generation config)"""
+        cache_key = (api_key, model_name, json.dumps(generation_config, sort_keys=True, default=str))
+        model = self._model_cache.get(cache_key)
+        if model is None:
+            model = genai.GenerativeModel(
+                model_name,
+                generation_config=genai.types.GenerationConfig(**generation_config)
+            )
+            # genai.configure süreç genelindeki tek istemciyi değiştirir; bunun yerine her model
+            # kendi anahtarının istemcisini kullanır, böylece eşzamanlı çağrılar birbirini ezmez.
+            # SDK model başına istemci için açık bir yol sunmaz; özel _client alanı 0.8.x'te
+            # generate_content tarafından okunur (requirements.txt bu yüzden <0.9 ile sabitli)
+            if not hasattr(model, '_client'):
+                raise RuntimeError(
+                    f"google-generativeai {genai.__version__} desteklenmiyor; requirements.txt'deki 0.8.x sürümünü kurun"
+                )
+            model._client = self._get_service_client(api_key)
+            self._model_cache[cache_key] = model
+        return model
+
+    @staticmethod
+    def _usage(response) -> Optional[TokenUsage]:
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None or not getattr(usage, 'total_token_count', 0):
+            return None
+        return TokenUsage(
+            prompt_tokens=getattr(usage, 'prompt_token_count', 0),
+            output_tokens=getattr(usage, 'candidates_token_count', 0),
+            total_tokens=usage.total_token_count
+        )
+
+    async def generate(self, api_key: str, prompt: str, model_name: str, generation_config: dict) -> LLMResult:
+        model = self._get_model(api_key, model_name, generation_config)
+        response = await asyncio.to_thread(model.generate_content, prompt)
+        return LLMResult(text=response.text, usage=self._usage(response))
+
+    async def stream(self, api_key: str, prompt: str, model_name: str, generation_config: dict):
+        """Run the SDK's blocking stream iterator in a thread and yield (text, usage) per chunk
+
+        If the consumer stops early (cancelled at the discussion deadline or closed), the thread
+        stops reading at the next chunk and drops the stream, which cancels the gRPC call instead
+        of letting it generate (and spend TPM) to the end.
+        """
+        model = self._get_model(api_key, model_name, generation_config)
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stopped = threading.Event()
+        
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # Event loop kapandı; okuyan kalmadı
+                stopped.set()
+        
+        def produce():
+            response = None
+            try:
+                response = model.generate_content(prompt, stream=True)
+                for chunk in response:
+                    if stopped.is_set():
+                        break
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Parçasız chunk (ör. güvenlik filtresi) metin taşımaz
+                        text = ''
+                    put(('chunk', text, self._usage(chunk)))
+                put(('done', None, None))
+            except Exception as e:
+                put(('error', e, None))
+            finally:
+                # Yanıt nesnesini bırakmak yarım kalan stream çağrısını iptal eder
+                del response
+        
+        producer = asyncio.ensure_future(asyncio.to_thread(produce))
+        try:
+            while True:
+                kind, value, usage = await queue.get()
+                if kind == 'chunk':
+                    yield value, usage
+                elif kind == 'error':
+                    raise value
+                else:
+                    break
+        finally:
+            stopped.set()
+        await producer
+
+
+FAKE_PERSONA_LINES = {
+    'Elif': [
+        "Ya açıkçası bu ülkede gençlere hiç kulak veren yok, hepsi koltuk derdinde.",
+        "Ben bunu okuyunca yine yurt dışına gitmeyi düşündüm, gerçekten çabalasak da olmuyor.",
+        "Kadınların can güvenliği yokken bunu konuşmamız bile absürt geliyor bana.",
+    ],
+    'Hatice Teyze': [
+        "Evladım, devletimize güvenmek lazım, bunları hep dış mihraklar çıkarıyor.",
+        "Bizim zamanımızda böyle şeyler yoktu, Allah devletimize zeval vermesin.",
+        "Muhalefet hep böyle, eleştirmekten başka bir şey bilmiyorlar.",
+    ],
+    'Kenan Bey': [
+        "Bakın, veriler ortada; enflasyon rakamları bu söylemlerle hiç örtüşmüyor.",
+        "Atatürk'ün gösterdiği çağdaşlık hedefinden her geçen gün uzaklaşıyoruz.",
+        "Bu akşam rakı masasında da aynısını konuştuk, değişim şart arkadaşlar.",
+    ],
+    'Tuğrul Bey': [
+        "Kardeşim esnaf olarak biz bunun bedelini her gün dükkanda ödüyoruz.",
+        "Bu işin arkasında başka hesaplar var, bana kimse masal anlatmasın.",
+        "Önce kendi vatandaşımızı düşüneceğiz, gerisi sonra gelir.",
+    ],
+}
+
+
+class FakeProvider(LLMProvider):
+    """Deterministic offline backend for load tests, profiling and CI benchmarks
+
+    Latency is drawn from a log-normal distribution (latency_median, latency_sigma); error_rate and
+    rate_limit_rate inject 503 and 429 errors. Reply text depends only on the prompt, while latency
+    and injected errors come from one seeded generator.
+    """
+    name = 'fake'
+    default_rpm_limit = 100_000
+    default_tpm_limit = 1_000_000_000
+
+    def __init__(self, latency_median: float = 0.8, latency_sigma: float = 0.5, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, seed: int = 0, key_count: int = 2, stream_chunk_words: int = 4):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.key_count = key_count
+        self.stream_chunk_words = stream_chunk_words
+        self.rng = random.Random(seed)
+        self.call_count = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency_median=float(os.getenv('FAKE_LLM_LATENCY', 0.8)),
+            latency_sigma=float(os.getenv('FAKE_LLM_LATENCY_SIGMA', 0.5)),
+            error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', 0.0)),
+            rate_limit_rate=float(os.getenv('FAKE_LLM_429_RATE', 0.0)),
+            seed=int(os.getenv('FAKE_LLM_SEED', 0)),
+            key_count=int(os.getenv('FAKE_LLM_KEYS', 2))
+        )
+
+    def default_api_keys(self) -> List[str]:
+        return [f"fake-key-{index}" for index in range(1, self.key_count + 1)]
+
+    def _latency(self) -> float:
+        if self.latency_median <= 0:
+            return 0.0
+        return self.rng.lognormvariate(np.log(self.latency_median), self.latency_sigma)
+
+    def _maybe_fail(self):
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            raise google_exceptions.ResourceExhausted("429 Resource has been exhausted (fake). Please retry in 2s")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise google_exceptions.ServiceUnavailable("503 The service is currently unavailable (fake)")
+
+    def _reply(self, prompt: str, generation_config: dict) -> str:
+        """Canned, prompt-type aware reply; the same prompt always gets the same text"""
+        rng = random.Random(int(hashlib.sha256(f"{self.seed}:{prompt}".encode('utf-8')).hexdigest()[:16], 16))
+        persona_match = re.search(r'Sen (.+?) adlı personasın', prompt) or re.search(r'İsim: (.+)', prompt)
+        persona_name = persona_match.group(1).strip() if persona_match else None
+        
+        if '[GÜNDEM MADDELERİ]' in prompt:
+            count = len(re.findall(r'\[MADDE \d+\]', prompt))
+            return json.dumps([{'id': index, 'score': rng.randint(1, 10)} for index in range(1, count + 1)])
+        if 'response_schema' in generation_config:
+            title = re.search(r'Başlık: (.+)', prompt)
+            score = rng.randint(1, 10)
+            memory = f"{title.group(1).strip() if title else 'Haber'} hakkında " + (
+                "sadece başlığı hatırlıyorum." if score <= 3 else
+                "ana fikri ve birkaç detayı hatırlıyorum." if score <= 7 else
+                "neredeyse tüm detayları hatırlıyorum."
+            )
+            return json.dumps({'score': score, 'memory': memory}, ensure_ascii=False)
+        if '1 ile 10 arasında bir sayı' in prompt:
+            return str(rng.randint(1, 10))
+        if 'Hatırlama Uzmanı' in prompt:
+            return "Haberin ana fikrini hatırlıyorum ama detayların çoğu aklımda kalmadı."
+        if 'Prof. Dr.' in prompt or 'Sosyal Araştırmacı' in prompt:
+            return "**1. YÖNETİCİ ÖZETİ**\n- Sahte sağlayıcı ile üretilmiş analiz raporu.\n\n**9. SONUÇ VE ÖNERİLER**\n- Katılımcılar farklı görüşler ortaya koydu."
+        if 'Geçiş Cümleleri' in prompt:
+            return json.dumps([
+                "Teşekkürler, şimdi sözü {isim}'e veriyorum.",
+                "{isim}, siz bu konuda ne düşünüyorsunuz?",
+                "Peki {isim}, sizin görüşünüz nedir?",
+                "Farklı bir bakış açısı duyalım, buyurun {isim}.",
+            ], ensure_ascii=False)
+        if 'Tartışma Özetleyicisi' in prompt:
+            speakers = sorted(set(re.findall(r'^([^:\n\[]+):', prompt.split('[YENİ MESAJLAR]')[-1], re.MULTILINE)))
+            return f"{', '.join(speakers)} görüşlerini paylaştı; katılımcılar arasında belirgin fikir ayrılıkları var."
+        if 'moderatör' in prompt.lower() and not persona_name:
+            return rng.choice([
+                "Teşekkürler, şimdi sözü bir sonraki katılımcımıza veriyorum.",
+                "Çok ilginç bir nokta. Peki siz bu konuda ne düşünüyorsunuz?",
+                "Bu görüşü not alalım, sıradaki konuşmacımızı dinleyelim.",
+            ])
+        if persona_name:
+            lines = FAKE_PERSONA_LINES.get(persona_name, ["Bu konuda benim de söyleyeceklerim var, açıkçası pek içime sinmiyor."])
+            return " ".join(rng.sample(lines, k=min(2, len(lines))))
+        return "Tamam."
+
+    async def generate(self, api_key: str, prompt: str, model_name: str, generation_config: dict) -> LLMResult:
+        self.call_count += 1
+        await asyncio.sleep(self._latency())
+        self._maybe_fail()
+        text = self._reply(prompt, generation_config)
+        prompt_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(text)
+        return LLMResult(text=text, usage=TokenUsage(prompt_tokens, output_tokens, prompt_tokens + output_tokens))
+
+    async def stream(self, api_key: str, prompt: str, model_name: str, generation_config: dict):
+        self.call_count += 1
+        latency = self._latency()
+        self._maybe_fail()
+        text = self._reply(prompt, generation_config)
+        words = text.split(' ')
+        chunks = [' '.join(words[i:i + self.stream_chunk_words]) + ' ' for i in range(0, len(words), self.stream_chunk_words)]
+        chunks[-1] = chunks[-1].rstrip()
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            yield chunk, None
+        prompt_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(text)
+        yield '', TokenUsage(prompt_tokens, output_tokens, prompt_tokens + output_tokens)
+
+
+# Tekrar oynatma eşleşmesinde yok sayılan saat damgaları (ör. analiz transkriptindeki [14:03:27])
+CLOCK_PATTERN = re.compile(r'\b\d{2}:\d{2}:\d{2}\b')
+
+
+def replay_key(prompt: str, model_name: str, generation_config: dict) -> str:
+    """Kayıt ve tekrar oynatma için istek anahtarı: önbellek anahtarıyla aynı, saat damgaları hariç"""
+    return LLMResponseCache.make_key(CLOCK_PATTERN.sub('--:--:--', prompt), model_name, generation_config)
+
+
+class RecordingProvider(LLMProvider):
+    """Wraps another provider and appends every successful reply to a JSONL recording
+
+    Each line holds the replay_key of the request, the reply text, token usage and latency, so a
+    ReplayProvider can re-run the same session offline. The recording is truncated on creation.
+    """
+    uses_cache = False
+
+    def __init__(self, inner: LLMProvider, path: str):
+        self.inner = inner
+        self.name = inner.name
+        self.default_rpm_limit = inner.default_rpm_limit
+        self.default_tpm_limit = inner.default_tpm_limit
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        open(path, 'w', encoding='utf-8').close()
+
+    def default_api_keys(self) -> List[str]:
+        return self.inner.default_api_keys()
+
+    def _write(self, key: str, text: str, usage: Optional[TokenUsage], latency: float):
+        record = {'key': key, 'text': text, 'latency': round(latency, 4)}
+        if usage is not None:
+            record['usage'] = [usage.prompt_tokens, usage.output_tokens, usage.total_tokens]
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def generate(self, api_key: str, prompt: str, model_name: str, generation_config: dict) -> LLMResult:
+        started = time.perf_counter()
+        result = await self.inner.generate(api_key, prompt, model_name, generation_config)
+        if result.text:
+            key = replay_key(prompt, model_name, generation_config)
+            self._write(key, result.text, result.usage, time.perf_counter() - started)
+        return result
+
+    async def stream(self, api_key: str, prompt: str, model_name: str, generation_config: dict):
+        started = time.perf_counter()
+        chunks = []
+        usage = None
+        async for text, chunk_usage in self.inner.stream(api_key, prompt, model_name, generation_config):
+            usage = chunk_usage or usage
+            if text:
+                chunks.append(text)
+            yield text, chunk_usage
+        if chunks:
+            key = replay_key(prompt, model_name, generation_config)
+            self._write(key, ''.join(chunks), usage, time.perf_counter() - started)
+
+
+class ReplayProvider(LLMProvider):
+    """Serves replies from a RecordingProvider recording instead of calling a model
+
+    Requests are matched by replay_key; repeated identical requests get the recorded replies in
+    order. A request missing from the recording fails with a non-retryable error. latency_scale
+    replays the recorded latencies (0 = as fast as possible, 1 = original timing).
+    """
+    name = 'replay'
+    default_rpm_limit = 100_000
+    default_tpm_limit = 1_000_000_000
+    uses_cache = False
+
+    def __init__(self, path: str, latency_scale: float = 0.0, stream_chunk_words: int = 4):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.stream_chunk_words = stream_chunk_words
+        self.misses = 0
+        self._replies: Dict[str, deque] = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._replies.setdefault(record['key'], deque()).append(record)
+        logger.info(f"Replay recording loaded: {sum(len(q) for q in self._replies.values())} replies from {path}")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv('LLM_REPLAY_PATH', 'recordings/session.jsonl'),
+            latency_scale=float(os.getenv('LLM_REPLAY_LATENCY_SCALE', 0.0))
+        )
+
+    def default_api_keys(self) -> List[str]:
+        return ['replay-key']
+
+    def _next(self, prompt: str, model_name: str, generation_config: dict) -> dict:
+        queue = self._replies.get(replay_key(prompt, model_name, generation_config))
+        if not queue:
+            self.misses += 1
+            raise google_exceptions.NotFound("Replay recording has no reply for this request")
+        # Son kayıt tükenmez; aynı istek kayıttakinden fazla tekrarlanırsa son yanıt döner
+        return queue.popleft() if len(queue) > 1 else queue[0]
+
+    @staticmethod
+    def _usage(record: dict) -> Optional[TokenUsage]:
+        usage = record.get('usage')
+        return TokenUsage(*usage) if usage else None
+
+    async def generate(self, api_key: str, prompt: str, model_name: str, generation_config: dict) -> LLMResult:
+        record = self._next(prompt, model_name, generation_config)
+        if self.latency_scale:
+            await asyncio.sleep(record['latency'] * self.latency_scale)
+        return LLMResult(text=record['text'], usage=self._usage(record))
+
+    async def stream(self, api_key: str, prompt: str, model_name: str, generation_config: dict):
+        record = self._next(prompt, model_name, generation_config)
+        words = record['text'].split(' ')
+        chunks = [' '.join(words[i:i + self.stream_chunk_words]) + ' ' for i in range(0, len(words), self.stream_chunk_words)]
+        chunks[-1] = chunks[-1].rstrip()
+        for chunk in chunks:
+            if self.latency_scale:
+                await asyncio.sleep(record['latency'] * self.latency_scale / len(chunks))
+            yield chunk, None
+        yield '', self._usage(record)
+
+
+@dataclass
+class LLMCallRecord:
+    """Timing and token accounting for one call_llm/call_llm_stream invocation (all attempts)"""
+    call_type: str
+    api_key: str = None
+    queue_wait: float = 0.0
+    latency: float = 0.0
+    first_token_latency: float = None
+    retries: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached: bool = False
+    success: bool = True
+    finished_at: float = 0.0
+
+
+def create_provider(name: str = None) -> LLMProvider:
+    """Build the provider named by `name` or the LLM_PROVIDER environment variable (default: gemini)"""
+    name = (name or os.getenv('LLM_PROVIDER', 'gemini')).lower()
+    if name == 'replay':
+        return ReplayProvider.from_env()
+    if name == 'fake':
+        provider = FakeProvider.from_env()
+    elif name == 'gemini':
+        provider = GeminiProvider()
+    else:
+        raise ValueError(f"Unknown LLM provider: {name}")
+    # LLM_RECORD_PATH ayarlıysa yanıtlar ReplayProvider için kaydedilir
+    record_path = os.getenv('LLM_RECORD_PATH')
+    return RecordingProvider(provider, record_path) if record_path else provider
+
+
+class LLMClient:
+    def __init__(self, provider: LLMProvider = None, cache_mode: str = None):
+        self.provider = provider or create_provider()
+        self.api_keys = APIKeyPool.discover_keys() if self.provider.name == 'gemini' else []
+        self.api_keys = self.api_keys or self.provider.default_api_keys()
+        self.api_key = self.api_keys[0] if self.api_keys else None
+        self.key_pool = APIKeyPool(
+            self.api_keys,
+            rpm_limit=int(os.getenv('GEMINI_RPM_LIMIT', self.provider.default_rpm_limit)),
+            tpm_limit=int(os.getenv('GEMINI_TPM_LIMIT', self.provider.default_tpm_limit))
+        )
+        self.model_name = 'gemini-1.5-flash'
+        self.generation_config = {
+            'temperature': 0.7,
+            'top_p': 0.8,
+            'top_k': 40,
+            'max_output_tokens': 3072,
+        }
+        self.response_cache = LLMResponseCache(
+            path=os.getenv('LLM_CACHE_PATH', '.cache/llm_cache.sqlite3'),
+            ttl_seconds=float(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600)),
+            max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', 5000)),
+            mode=(cache_mode or os.getenv('LLM_CACHE_MODE', 'readwrite')) if self.provider.uses_cache else 'bypass'
+        )
+        self.retry_policy = RetryPolicy()
+        self.auth_failure_cooldown = 3600
         self.max_retries = 3
         self.request_count = 0
         self.last_request_time = time.time()
-        self.min_request_interval = 4
         self.request_log = []
+        # request_log son 100 kaydı tutar; istatistikler için sınırsız sayaçlar
+        self.successful_requests = 0
+        self.failed_requests = 0
+        self.call_records = deque(maxlen=5000)
+        self.parse_stats = {}
 
-    def _switch_api_key(self):
-        current_time = time.time()
-        if current_time - self.last_switch_time >= self.switch_interval:
-            if self.api_key_2:
-                self.current_api_key = self.api_key_2 if self.current_api_key == self.api_key else self.api_key
-            self.last_switch_time = current_time
-            logger.info(f"API anahtarı değiştirildi: {self.current_api_key[:10]}...")
-            self.request_count = 0
+    def record_parse(self, kind: str, outcome: str):
+        """Count structured-output parse outcomes ('ok', 'repaired', 'failed') per call kind"""
+        counters = self.parse_stats.setdefault(kind, {'ok': 0, 'repaired': 0, 'failed': 0})
+        counters[outcome] += 1
+        if outcome == 'failed':
+            logger.warning(f"{kind} yanıtı ayrıştırılamadı")
 
-    def _log_request(self, success: bool, error: str = None):
+    def _log_request(self, success: bool, error: str = None, api_key: str = None):
         log_entry = {
             'timestamp': datetime.now(),
-            'api_key': self.current_api_key[:10] + '...' if self.current_api_key else 'None',
+            'api_key': api_key[:10] + '...' if api_key else 'None',
             'request_count': self.request_count,
             'success': success,
             'error': error
         }
+        if success:
+            self.successful_requests += 1
+        else:
+            self.failed_requests += 1
         self.request_log.append(log_entry)
         if len(self.request_log) > 100:
             self.request_log = self.request_log[-100:]
 
-    async def call_llm(self, prompt: str, max_retries: int = 3) -> str:
+    async def _retry_after_error(self, key_state: APIKeyState, error: Exception, attempt: int, max_retries: int,
+                                 estimated_tokens: int = 0) -> bool:
+        """Record a failed attempt against its key and decide whether (and when) to retry"""
+        api_key = key_state.api_key
+        error_msg = str(error)
+        kind = classify_error(error)
+        retry_after = parse_retry_after(error)
+        delay = self.retry_policy.delay(attempt, retry_after)
+        logger.error(f"LLM call failed ({kind}): {error_msg}")
+        self._log_request(success=False, error=error_msg, api_key=api_key)
+        
+        if kind == 'rate_limit':
+            key_state.breaker.record_failure(delay, trip=True)
+        elif kind == 'auth':
+            key_state.breaker.record_failure(self.auth_failure_cooldown, trip=True)
+        else:
+            key_state.breaker.record_failure(delay)
+        
+        if attempt == max_retries - 1:
+            return False
+        if kind == 'fatal' or (kind == 'auth' and len(self.key_pool) == 1):
+            # Aynı istek tekrar gönderilse de sonuç değişmez
+            return False
+        
+        if self.key_pool.has_capacity(estimated_tokens, exclude=key_state):
+            logger.warning(f"Anahtar {api_key[:10]}... devre dışı/başarısız, istek başka anahtara yönlendiriliyor (Deneme {attempt + 1}/{max_retries})")
+            return True
+        
+        if key_state.breaker.state == 'open':
+            # Devre açıkken acquire zaten anahtar yeniden kullanılabilir olana kadar bekler
+            logger.warning(f"Tüm anahtarlar meşgul, acquire {key_state.breaker.wait_time():.1f} saniye bekleyecek (Deneme {attempt + 1}/{max_retries})")
+            return True
+        
+        logger.warning(f"{delay:.1f} saniye sonra tekrar denenecek (Deneme {attempt + 1}/{max_retries})")
+        await asyncio.sleep(delay)
+        return True
+
+    async def call_llm(self, prompt: str, max_retries: int = 3, use_cache: bool = True,
+                       generation_config: dict = None, call_type: str = 'other') -> str:
+        chunks = [chunk async for chunk in self._call(
+            prompt, max_retries, use_cache, generation_config, call_type, stream=False
+        )]
+        return ''.join(chunks)
+
+    async def call_llm_stream(self, prompt: str, max_retries: int = 3, use_cache: bool = True,
+                              generation_config: dict = None, call_type: str = 'other'):
+        """Async generator that yields the response text chunk by chunk as the model produces it"""
+        async for chunk in self._call(
+            prompt, max_retries, use_cache, generation_config, call_type, stream=True
+        ):
+            yield chunk
+
+    async def _call(self, prompt: str, max_retries: int, use_cache: bool, generation_config: dict,
+                    call_type: str, stream: bool):
+        """Shared body of call_llm/call_llm_stream: cache, key pool, retries, breaker and accounting
+
+        Yields the reply text; with stream=False the provider's generate() reply is a single chunk.
+        """
+        # Çağrıya özel ayarlar (ör. JSON çıktı) varsayılan üretim ayarlarının üzerine yazılır
+        generation_config = {**self.generation_config, **(generation_config or {})}
+        cache_key = None
+        if use_cache:
+            cache_key = LLMResponseCache.make_key(prompt, self.model_name, generation_config, self.provider.name)
+            # SQLite okuma/yazması paylaşılan event loop'u bekletmesin
+            cached_response = await asyncio.to_thread(self.response_cache.get, cache_key)
+            if cached_response is not None:
+                logger.info("LLM yanıtı önbellekten döndü")
+                self._record_call(LLMCallRecord(call_type=call_type, cached=True))
+                yield cached_response
+                return
+        
+        if not self.key_pool:
+            self._log_request(success=False, error="API key not found")
+            yield LLM_NO_KEY_MESSAGE
+            return
+        
+        estimated_tokens = estimate_tokens(prompt)
+        record = LLMCallRecord(call_type=call_type)
+        label = "LLM stream isteği" if stream else "LLM isteği"
         for attempt in range(max_retries):
+            wait_started = time.perf_counter()
+            key_state = await self.key_pool.acquire(estimated_tokens)
+            record.queue_wait += time.perf_counter() - wait_started
+            record.retries = attempt
+            api_key = key_state.api_key
+            record.api_key = api_key[:10] + '...'
+            request_started = time.perf_counter()
+            chunks = []
             try:
-                current_time = time.time()
-                time_since_last_request = current_time - self.last_request_time
-                if time_since_last_request < self.min_request_interval:
-                    wait_time = self.min_request_interval - time_since_last_request
-                    logger.info(f"İstekler arası bekleme: {wait_time:.1f} saniye")
-                    await asyncio.sleep(wait_time)
-
-                self._switch_api_key()
                 self.request_count += 1
                 self.last_request_time = time.time()
                 
-                logger.info(f"LLM isteği gönderiliyor (Deneme {attempt + 1}/{max_retries}, İstek #{self.request_count})")
-                
-                if not self.current_api_key:
-                    self._log_request(success=False, error="API key not found")
-                    return "API anahtarı bulunamadı. Lütfen .env dosyasını kontrol edin."
+                logger.info(f"{label} gönderiliyor (Deneme {attempt + 1}/{max_retries}, İstek #{self.request_count}, Anahtar {api_key[:10]}...)")
                 
-                genai.configure(api_key=self.current_api_key)
-                model = genai.GenerativeModel('gemini-1.5-flash')
+                if stream:
+                    usage = None
+                    async for text, chunk_usage in self.provider.stream(
+                        api_key, prompt, self.model_name, generation_config
+                    ):
+                        usage = chunk_usage or usage
+                        if text:
+                            if not chunks:
+                                record.first_token_latency = time.perf_counter() - request_started
+                            chunks.append(text)
+                            yield text
+                else:
+                    result = await self.provider.generate(api_key, prompt, self.model_name, generation_config)
+                    usage = result.usage
+                record.latency = time.perf_counter() - request_started
                 
-                response = await asyncio.to_thread(
-                    model.generate_content,
-                    prompt,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.7,
-                        top_p=0.8,
-                        top_k=40,
-                        max_output_tokens=3072,
-                    )
-                )
+                if usage is not None and usage.total_tokens:
+                    self.key_pool.settle(key_state, estimated_tokens, usage.total_tokens)
+                    record.prompt_tokens = usage.prompt_tokens
+                    record.output_tokens = usage.output_tokens
                 
-                if response.text:
-                    self._log_request(success=True)
-                    return response.text
+                key_state.breaker.record_success()
+                full_text = ''.join(chunks) if stream else result.text
+                if full_text:
+                    self._log_request(success=True, api_key=api_key)
+                    self._record_call(record)
+                    if cache_key is not None:
+                        await asyncio.to_thread(self.response_cache.set, cache_key, full_text)
+                    if not stream:
+                        yield full_text
                 else:
                     logger.warning("Empty response from LLM")
-                    self._log_request(success=False, error="Empty response")
-                    return "Üzgünüm, şu anda yanıt veremiyorum."
-                    
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"LLM call failed: {error_msg}")
-                self._log_request(success=False, error=error_msg)
-                
-                if "429" in error_msg:
-                    if attempt < max_retries - 1:
-                        wait_time = self.retry_delay
-                        logger.warning(f"Rate limit aşıldı. {wait_time} saniye bekleniyor... (Deneme {attempt + 1}/{max_retries})")
-                        await asyncio.sleep(wait_time)
-                        continue
-                
-                if attempt == max_retries - 1:
-                    return "Üzgünüm, şu anda yanıt veremiyorum. Lütfen daha sonra tekrar deneyin."
+                    self._log_request(success=False, error="Empty response", api_key=api_key)
+                    record.success = False
+                    self._record_call(record)
+                    yield LLM_UNAVAILABLE_MESSAGE
+                return
                 
-                await asyncio.sleep(1)
+            except Exception as e:
+                record.latency = time.perf_counter() - request_started
+                if chunks:
+                    # Kısmi metin zaten iletildi; yeniden denemek yanıtı tekrarlar
+                    logger.error(f"LLM stream interrupted: {e}")
+                    self._log_request(success=False, error=str(e), api_key=api_key)
+                    key_state.breaker.record_failure(self.retry_policy.delay(attempt, parse_retry_after(e)))
+                    record.success = False
+                    self._record_call(record)
+                    return
+                if not await self._retry_after_error(key_state, e, attempt, max_retries, estimated_tokens):
+                    record.success = False
+                    self._record_call(record)
+                    yield LLM_RETRY_LATER_MESSAGE
+                    return
+
+    def _record_call(self, record: 'LLMCallRecord'):
+        record.finished_at = time.time()
+        self.call_records.append(record)
+
+    def get_latency_stats(self) -> Dict[str, dict]:
+        """p50/p95/p99 network latency and mean queue wait per call type (cache hits excluded)"""
+        by_type = {}
+        for record in self.call_records:
+            by_type.setdefault(record.call_type, []).append(record)
+        stats = {}
+        for call_type, records in by_type.items():
+            network = [r for r in records if not r.cached]
+            latencies = np.array([r.latency for r in network]) if network else np.array([0.0])
+            stats[call_type] = {
+                'calls': len(records),
+                'cache_hits': len(records) - len(network),
+                'failures': sum(1 for r in network if not r.success),
+                'retries': sum(r.retries for r in network),
+                'p50': float(np.percentile(latencies, 50)),
+                'p95': float(np.percentile(latencies, 95)),
+                'p99': float(np.percentile(latencies, 99)),
+                'mean_queue_wait': float(np.mean([r.queue_wait for r in network])) if network else 0.0,
+                'prompt_tokens': sum(r.prompt_tokens for r in network),
+                'output_tokens': sum(r.output_tokens for r in network),
+            }
+        return stats
+
+    def tokens_per_minute(self, window: float = 60.0) -> float:
+        """Prompt + output tokens of calls that finished within the last `window` seconds, per minute"""
+        cutoff = time.time() - window
+        tokens = sum(r.prompt_tokens + r.output_tokens for r in self.call_records if r.finished_at >= cutoff)
+        return tokens * 60.0 / window
 
     def get_request_stats(self) -> dict:
-        total_requests = len(self.request_log)
-        successful_requests = sum(1 for log in self.request_log if log['success'])
-        failed_requests = total_requests - successful_requests
+        total_requests = self.successful_requests + self.failed_requests
         
         return {
             'total_requests': total_requests,
-            'successful_requests': successful_requests,
-            'failed_requests': failed_requests,
-            'success_rate': (successful_requests / total_requests * 100) if total_requests > 0 else 0,
+            'successful_requests': self.successful_requests,
+            'failed_requests': self.failed_requests,
+            'success_rate': (self.successful_requests / total_requests * 100) if total_requests > 0 else 0,
             'current_request_count': self.request_count,
-            'last_request_time': self.last_request_time
+            'last_request_time': self.last_request_time,
+            'provider': self.provider.name,
+            'api_key_count': len(self.key_pool),
+            'requests_per_key': {state.api_key[:10] + '...': state.request_count for state in self.key_pool.keys},
+            'key_states': {state.api_key[:10] + '...': state.breaker.state for state in self.key_pool.keys},
+            'cache': self.response_cache.stats(),
+            'parse': self.parse_stats,
+            'latency_by_type': self.get_latency_stats(),
+            'tokens_per_minute': self.tokens_per_minute()
         }
 
+SCORE_AND_MEMORY_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'score': {'type': 'integer'},
+        'memory': {'type': 'string'}
+    },
+    'required': ['score', 'memory']
+}
+
 class MCPThinkingAgent:
     def __init__(self, llm_client: LLMClient, simulator=None):
         self.llm_client = llm_client
         self.simulator = simulator
+        self.batch_token_budget = 24000
+        self.batch_max_items = 20
+    
+    @staticmethod
+    def _fit_item_sections(kind: str, profile: PromptBlock, item: AgendaItem) -> Dict[str, str]:
+        """Profil ve gündem maddesi alanlarını prompt türünün bütçesine sığdır; önce yorumlar kısalır"""
+        return fit_prompt_sections(kind, [
+            PromptSection('profile', profile.text, priority=3),
+            PromptSection('title', item.title, priority=4, max_tokens=100),
+            PromptSection('content', item.content, priority=2, max_tokens=2000, min_tokens=200),
+            PromptSection('comments', item.comments, priority=1, max_tokens=800),
+        ])
     
     async def score_agenda_item(self, persona: Persona, item: AgendaItem) -> float:
+        fitted = self._fit_item_sections('score', persona.render('scoring'), item)
         prompt = f"""[SİSTEM MESAJI]
 Sen bir "İçerik Puanlama Uzmanı"sın. Sana bir persona profili ve bir gündem maddesi verilecektir. Bu persona rolüne bürünerek, gündem maddesine 1'den 10'a kadar bir "ilgi ve hatırlama" puanı ver.
 
 [PERSONA PROFİLİ]
-İsim: {persona.name}
-Rol: {persona.role}
-Kişilik: {persona.personality}
-Biyo: {persona.bio}
-Geçmiş: {persona.lore}
-Bilgi: {persona.knowledge}
-Konular: {persona.topics}
-Stil: {persona.style}
-Sıfatlar: {persona.adjectives}
+{fitted['profile']}
 
 [GÜNDEM MADDESİ]
-Başlık: {item.title}
-İçerik: {item.content}
-Yorumlar: {item.comments}
+Başlık: {fitted['title']}
+İçerik: {fitted['content']}
+Yorumlar: {fitted['comments']}
 
 [TALİMATLAR]
 1. Yukarıdaki persona profilini ve gündem maddesini dikkatlice oku.
@@ -221,30 +1351,120 @@ Yorumlar: {item.comments}
 3. Yanıtın sadece 1 ile 10 arasında bir sayı olsun. Başka hiçbir metin veya açıklama ekleme.
 """
         
-        response = await self.llm_client.call_llm(prompt)
+        response = await self.llm_client.call_llm(prompt, call_type='score')
         try:
             score = float(re.search(r'\d+', response).group())
+            self.llm_client.record_parse('score', 'ok')
             return min(max(score, 1), 10)
-        except:
+        except (AttributeError, ValueError):
+            self.llm_client.record_parse('score', 'failed')
             return 5.0
 
+    @staticmethod
+    def _batch_item_block(index: int, item: AgendaItem) -> str:
+        """Toplu puanlamada her madde kendi küçük bütçesine sığdırılır"""
+        fitted = fit_prompt_sections('batch_item', [
+            PromptSection('title', item.title, priority=3, max_tokens=60),
+            PromptSection('content', item.content, priority=2, max_tokens=350, min_tokens=100),
+            PromptSection('comments', item.comments, priority=1, max_tokens=120),
+        ])
+        return f"[MADDE {index}]\nBaşlık: {fitted['title']}\nİçerik: {fitted['content']}\nYorumlar: {fitted['comments']}"
+
+    def _build_batch_scoring_prompt(self, persona: Persona, items: List[AgendaItem]) -> str:
+        agenda_block = "\n\n".join(
+            self._batch_item_block(index, item) for index, item in enumerate(items, 1)
+        )
+        return f"""[SİSTEM MESAJI]
+Sen bir "İçerik Puanlama Uzmanı"sın. Sana bir persona profili ve numaralandırılmış gündem maddeleri verilecektir. Bu persona rolüne bürünerek, her gündem maddesine 1'den 10'a kadar bir "ilgi ve hatırlama" puanı ver.
+
+[PERSONA PROFİLİ]
+{persona.render('scoring').text}
+
+[GÜNDEM MADDELERİ]
+{agenda_block}
+
+[TALİMATLAR]
+1. Yukarıdaki persona profilini ve gündem maddelerini dikkatlice oku.
+2. Personanın rolü, kişiliği ve diğer özelliklerini referans alarak, her maddenin persona için ne kadar alakalı ve önemli olduğunu değerlendir.
+3. Yanıtın sadece bir JSON dizisi olsun: [{{"id": 1, "score": 7}}, {{"id": 2, "score": 3}}, ...]. Her madde için tam olarak bir kayıt olmalı, "score" 1 ile 10 arasında bir tam sayı olmalı. Başka hiçbir metin ekleme.
+"""
+
+    def _chunk_for_batch_scoring(self, persona: Persona, items: List[AgendaItem]) -> List[List[AgendaItem]]:
+        """Split items into chunks whose prompt fits batch_token_budget and batch_max_items"""
+        base_tokens = estimate_tokens(self._build_batch_scoring_prompt(persona, []))
+        chunks, current, current_tokens = [], [], base_tokens
+        for item in items:
+            item_tokens = estimate_tokens(self._batch_item_block(0, item))
+            if current and (current_tokens + item_tokens > self.batch_token_budget or len(current) >= self.batch_max_items):
+                chunks.append(current)
+                current, current_tokens = [], base_tokens
+            current.append(item)
+            current_tokens += item_tokens
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def _parse_batch_scores(response: str, count: int) -> Dict[int, float]:
+        """Parse a JSON score array into {0-based index: score}; malformed entries are left out"""
+        match = re.search(r'\[.*\]', response, re.DOTALL)
+        if not match:
+            return {}
+        try:
+            data = json.loads(match.group())
+        except json.JSONDecodeError:
+            return {}
+        scores = {}
+        if isinstance(data, list) and len(data) == count and all(isinstance(v, (int, float)) for v in data):
+            # Sadece sayılardan oluşan dizi: sıra maddelerle aynı kabul edilir
+            data = [{'id': index, 'score': value} for index, value in enumerate(data, 1)]
+        for entry in data if isinstance(data, list) else []:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                index = int(entry.get('id')) - 1
+                score = float(entry.get('score'))
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < count and 1 <= score <= 10:
+                scores[index] = score
+        return scores
+
+    async def score_agenda_items_batch(self, persona: Persona, items: List[AgendaItem]) -> List[float]:
+        """Score many agenda items for one persona with one request per chunk instead of one per item"""
+        scores: List[Optional[float]] = [None] * len(items)
+        position = 0
+        for chunk in self._chunk_for_batch_scoring(persona, items):
+            prompt = self._build_batch_scoring_prompt(persona, chunk)
+            response = await self.llm_client.call_llm(
+                prompt, generation_config={'response_mime_type': 'application/json'}, call_type='score'
+            )
+            parsed = self._parse_batch_scores(response, len(chunk))
+            for offset in range(len(chunk)):
+                if offset in parsed:
+                    scores[position + offset] = parsed[offset]
+            position += len(chunk)
+        
+        missing = [index for index, score in enumerate(scores) if score is None]
+        if missing:
+            logger.warning(f"Toplu puanlama {persona.name} için {len(missing)} maddede geçersiz çıktı verdi, tek tek puanlanıyor")
+            fallback_scores = await asyncio.gather(*(self.score_agenda_item(persona, items[index]) for index in missing))
+            for index, score in zip(missing, fallback_scores):
+                scores[index] = score
+        return scores
+
     async def summarize_for_persona(self, persona, agenda_item, score):
+        fitted = self._fit_item_sections('memory', persona.render('memory'), agenda_item)
         prompt = f"""[SİSTEM MESAJI]
 Sen bir "Hatırlama Uzmanı"sın. Sana bir persona profili, bir haber ve bu personanın haberi okuma dikkat seviyesi (1-10) verilecek. Lütfen, bu persona bu haberi bu dikkat seviyesiyle okusa, neleri hatırlar, neleri unutur, hangi ana fikri aklında tutar, özetle. Yanıtın sadece persona'nın aklında kalanlar olsun.
 
 [PERSONA PROFİLİ]
-İsim: {persona.name}
-Biyo: {persona.bio}
-Geçmiş: {persona.lore}
-Bilgi: {persona.knowledge}
-Konular: {persona.topics}
-Stil: {persona.style}
-Sıfatlar: {persona.adjectives}
+{fitted['profile']}
 
 [GÜNDEM MADDESİ]
-Başlık: {agenda_item.title}
-İçerik: {agenda_item.content}
-Yorumlar: {agenda_item.comments}
+Başlık: {fitted['title']}
+İçerik: {fitted['content']}
+Yorumlar: {fitted['comments']}
 
 [DİKKAT SEVİYESİ]: {score}
 
@@ -254,41 +1474,191 @@ Yorumlar: {agenda_item.comments}
 - Dikkat seviyesi yüksekse, çoğu detayı ve ana fikri hatırla.
 - Yanıtın sadece persona'nın aklında kalanlar olsun, başka açıklama ekleme.
 """
-        response = await self.llm_client.call_llm(prompt)
-        log_entry = {"type": "memory", "prompt": prompt, "response": response}
+        response = await self.llm_client.call_llm(prompt, call_type='memory')
+        self._log_mcp({"type": "memory", "prompt": prompt, "response": response})
+        return response.strip()
+
+    def _log_mcp(self, log_entry: dict):
         mcp_logs.append(log_entry)
         if self.simulator is not None and hasattr(self.simulator, 'mcp_logs'):
             self.simulator.mcp_logs.append(log_entry)
-        return response.strip()
+
+    @staticmethod
+    def _parse_score_and_memory(response: str):
+        """Validate a {score, memory} reply; returns (score, memory, outcome) with None for unusable fields
+
+        outcome is 'ok' for valid JSON, 'repaired' when fields had to be recovered or clamped locally
+        and 'failed' when neither field could be recovered.
+        """
+        score, memory, outcome = None, None, 'ok'
+        match = re.search(r'\{.*\}', response, re.DOTALL)
+        data = None
+        if match:
+            try:
+                data = json.loads(match.group())
+            except json.JSONDecodeError:
+                data = None
+        if isinstance(data, dict):
+            if match.group().strip() != response.strip():
+                outcome = 'repaired'
+            raw_score, memory = data.get('score'), data.get('memory')
+        else:
+            # Bozuk JSON: alanlar tek tek düzenli ifadeyle kurtarılmaya çalışılır
+            outcome = 'repaired'
+            score_match = re.search(r'"score"\s*:\s*"?(\d+(?:\.\d+)?)', response)
+            memory_match = re.search(r'"memory"\s*:\s*"((?:[^"\\]|\\.)*)', response, re.DOTALL)
+            raw_score = score_match.group(1) if score_match else None
+            memory = memory_match.group(1).replace('\\n', '\n').replace('\\"', '"') if memory_match else None
+        try:
+            score = float(raw_score)
+            if not 1 <= score <= 10:
+                outcome = 'repaired'
+                score = min(max(score, 1), 10)
+        except (TypeError, ValueError):
+            score = None
+        if not isinstance(memory, str) or not memory.strip():
+            memory = None
+        if score is None and memory is None:
+            outcome = 'failed'
+        elif score is None or memory is None:
+            outcome = 'repaired'
+        return score, memory.strip() if memory else None, outcome
+
+    async def score_and_remember(self, persona: Persona, agenda_item: AgendaItem):
+        """Return (score, memory) for a persona/item pair from a single schema-constrained call"""
+        fitted = self._fit_item_sections('score_memory', persona.render('scoring'), agenda_item)
+        prompt = f"""[SİSTEM MESAJI]
+Sen hem bir "İçerik Puanlama Uzmanı" hem de bir "Hatırlama Uzmanı"sın. Sana bir persona profili ve bir haber verilecek. Önce bu persona rolüne bürünerek habere 1'den 10'a kadar bir "ilgi ve hatırlama" puanı ver. Sonra bu persona haberi bu dikkat seviyesiyle okusa aklında neyin kalacağını özetle.
+
+[PERSONA PROFİLİ]
+{fitted['profile']}
+
+[GÜNDEM MADDESİ]
+Başlık: {fitted['title']}
+İçerik: {fitted['content']}
+Yorumlar: {fitted['comments']}
+
+[TALİMATLAR]
+- "score": Personanın rolü, kişiliği ve diğer özelliklerine göre haberin persona için ne kadar alakalı ve önemli olduğu (1-10 arası tam sayı).
+- "memory": Bu puanı dikkat seviyesi kabul ederek personanın aklında kalanlar. Dikkat düşükse önemli detayları atla veya unut, ortaysa ana fikri ve bazı detayları, yüksekse çoğu detayı ve ana fikri hatırla. Başka açıklama ekleme.
+- Yanıtın sadece {{"score": ..., "memory": "..."}} biçiminde bir JSON nesnesi olsun.
+"""
+        response = await self.llm_client.call_llm(prompt, generation_config={
+            'response_mime_type': 'application/json',
+            'response_schema': SCORE_AND_MEMORY_SCHEMA
+        }, call_type='score_memory')
+        score, memory, outcome = self._parse_score_and_memory(response)
+        self.llm_client.record_parse('score_and_memory', outcome)
+        
+        # Kurtarılamayan alan için eski ayrı çağrılara geri dönülür
+        if score is None:
+            score = await self.score_agenda_item(persona, agenda_item)
+        if memory is None:
+            memory = await self.summarize_for_persona(persona, agenda_item, score)
+        else:
+            self._log_mcp({"type": "memory", "prompt": prompt, "response": response})
+        return score, memory
+
+TURKISH_STOPWORDS = {
+    'acaba', 'ama', 'ancak', 'aslında', 'bana', 'bazı', 'belki', 'ben', 'benim', 'beni', 'bile', 'biraz',
+    'birçok', 'biz', 'bizim', 'bu', 'buna', 'bunu', 'bunlar', 'çok', 'çünkü', 'daha', 'diye', 'değil',
+    'eğer', 'gibi', 'göre', 'hem', 'hep', 'her', 'hiç', 'için', 'ile', 'ise', 'işte', 'kadar', 'kendi',
+    'ki', 'mi', 'mı', 'mu', 'mü', 'nasıl', 'ne', 'neden', 'olan', 'olarak', 'oldu', 'olduğu', 'onlar',
+    'onu', 'onun', 'sadece', 'sen', 'siz', 'şey', 'şimdi', 'şu', 'tabii', 'var', 've', 'veya', 'ya',
+    'yani', 'yok', 'zaten', 'bir', 'da', 'de', 'en',
+}
+
+
+def lexical_terms(text: str, prefix_length: int = 5) -> List[str]:
+    """Türkçe için basit terim çıkarımı: küçük harf, stopword eleme ve ilk 5 harfle kök yaklaşımı"""
+    text = text.replace('İ', 'i').replace('I', 'ı').lower()
+    return [
+        word[:prefix_length] for word in re.findall(r'\w+', text)
+        if len(word) > 2 and word not in TURKISH_STOPWORDS and not word.isdigit()
+    ]
+
+
+class TranscriptIndex:
+    """discussion_log üzerinde artımlı BM25 indeksi
+
+    Her mesaj eklendiğinde yalnızca kendi terimleri posting listelerine eklenir; sorgu sırasında
+    skorlar numpy ile sorgu terimlerinin posting'leri üzerinden hesaplanır.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.reset()
+
+    def reset(self):
+        self.entries: List[dict] = []
+        self.speakers: List[str] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, tuple] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry: dict):
+        doc_id = len(self.entries)
+        terms = lexical_terms(entry['message'])
+        self.entries.append(entry)
+        self.speakers.append(entry['speaker'])
+        self.doc_lengths.append(len(terms))
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            doc_ids, term_freqs = self.postings.setdefault(term, ([], []))
+            doc_ids.append(doc_id)
+            term_freqs.append(count)
+
+    def search(self, query: str, k: int = 3, before_index: int = None,
+               exclude_speakers: tuple = ('Moderatör',)) -> List[tuple]:
+        """(doc_id, skor, mesaj) listesi; before_index'ten önceki mesajlar arasından en alakalı k tanesi"""
+        limit = len(self.entries) if before_index is None else max(0, min(before_index, len(self.entries)))
+        if limit == 0:
+            return []
+        doc_lengths = np.asarray(self.doc_lengths[:limit], dtype=float)
+        avg_length = doc_lengths.mean() or 1.0
+        scores = np.zeros(limit)
+        for term in set(lexical_terms(query)):
+            if term not in self.postings:
+                continue
+            doc_ids = np.asarray(self.postings[term][0])
+            term_freqs = np.asarray(self.postings[term][1], dtype=float)
+            mask = doc_ids < limit
+            doc_ids, term_freqs = doc_ids[mask], term_freqs[mask]
+            if doc_ids.size == 0:
+                continue
+            idf = np.log(1 + (limit - doc_ids.size + 0.5) / (doc_ids.size + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[doc_ids] / avg_length)
+            scores[doc_ids] += idf * term_freqs * (self.k1 + 1) / (term_freqs + norm)
+        if exclude_speakers:
+            scores[np.isin(np.asarray(self.speakers[:limit]), exclude_speakers)] = 0
+        top = np.argsort(-scores, kind='stable')[:k]
+        return [(int(doc_id), float(scores[doc_id]), self.entries[doc_id]) for doc_id in top if scores[doc_id] > 0]
+
 
 class FocusGroupAgent:
+    retrieval_k = 3
+    # Son bu kadar mesaj zaten bağlamda olduğu için geri getirmede aranmaz
+    retrieval_window = 12
+
     def __init__(self, persona: Persona, llm_client: LLMClient, mcp_agent: MCPThinkingAgent):
         self.persona = persona
         self.llm_client = llm_client
         self.mcp_agent = mcp_agent
         self.conversation_history = []
-    
-    async def generate_response(self, context: str, agenda_item: AgendaItem) -> str:
-        memory_summary = agenda_item.persona_memories.get(self.persona.name, None)
-        
-        if memory_summary:
-            prompt = f"""[SİSTEM MESAJI]
-Sen {self.persona.name} adlı personasın. Sana ait tüm kişisel bilgiler, geçmiş, bilgi alanları, konuşma tarzı ve sıfatlar aşağıda verilmiştir. Odak grup tartışmasında, bu karakterine tamamen uygun bir şekilde hareket etmeli ve konuşmalısın.
-
-[PERSONA PROFİLİ]
-İsim: {self.persona.name}
-Biyo: {self.persona.bio}
-Geçmiş: {self.persona.lore}
-Bilgi: {self.persona.knowledge}
-Konular: {self.persona.topics}
-Stil: {self.persona.style}
-Sıfatlar: {self.persona.adjectives}
 
-[TARTIŞMA BAĞLAMI]
-{context}
-Şu anki gündem maddesi (senin hatırladığın kadarıyla): {memory_summary}
+    def _profile_block(self) -> str:
+        return f"""[PERSONA PROFİLİ]
+{self.persona.render('dialogue').text}"""
 
-[TALİMATLAR]
+    @staticmethod
+    def _instructions(with_memory: bool) -> str:
+        if with_memory:
+            return """[TALİMATLAR]
 1. "bio", "lore", "knowledge", "topics", "style" ve "adjectives" alanlarını her yanıtında içselleştir.
 2. Yanıtların, personanın yaşından, eğitiminden, sosyo-ekonomik durumundan ve inançlarından etkilenmiş olmalıdır.
 3. "style" (all, chat, post) ve "adjectives" özelliklerini konuşma tarzına ve kelime seçimine yansıt.
@@ -297,24 +1667,7 @@ Sıfatlar: {self.persona.adjectives}
 6. Yanıtların doğal ve gerçekçi olmalı, yapay zeka tarafından üretildiği anlaşılmamalıdır.
 7. Sadece personanın söyleyeceği sözleri yaz. Açıklama veya meta-yorum yapma.
 """
-        else:
-            prompt = f"""[SİSTEM MESAJI]
-Sen {self.persona.name} adlı personasın. Sana ait tüm kişisel bilgiler, geçmiş, bilgi alanları, konuşma tarzı ve sıfatlar aşağıda verilmiştir. Odak grup tartışmasında, bu karakterine tamamen uygun bir şekilde hareket etmeli ve konuşmalısın.
-
-[PERSONA PROFİLİ]
-İsim: {self.persona.name}
-Biyo: {self.persona.bio}
-Geçmiş: {self.persona.lore}
-Bilgi: {self.persona.knowledge}
-Konular: {self.persona.topics}
-Stil: {self.persona.style}
-Sıfatlar: {self.persona.adjectives}
-
-[TARTIŞMA BAĞLAMI]
-{context}
-Şu anki gündem maddesi: {agenda_item.title} - {agenda_item.content}
-
-[TALİMATLAR]
+        return """[TALİMATLAR]
 1. "bio", "lore", "knowledge", "topics", "style" ve "adjectives" alanlarını her yanıtında içselleştir.
 2. Yanıtların, personanın yaşından, eğitiminden, sosyo-ekonomik durumundan ve inançlarından etkilenmiş olmalıdır.
 3. "style" ve "adjectives" özelliklerini konuşma tarzına ve kelime seçimine yansıt.
@@ -322,27 +1675,161 @@ Sıfatlar: {self.persona.adjectives}
 5. Yanıtların doğal ve gerçekçi olmalı, yapay zeka tarafından üretildiği anlaşılmamalıdır.
 6. Sadece personanın söyleyeceği sözleri yaz. Açıklama veya meta-yorum yapma.
 """
-        
-        response = await self.llm_client.call_llm(prompt)
-        return response.strip()
+
+    def _system_header(self) -> str:
+        return f"""[SİSTEM MESAJI]
+Sen {self.persona.name} adlı personasın. Sana ait tüm kişisel bilgiler, geçmiş, bilgi alanları, konuşma tarzı ve sıfatlar aşağıda verilmiştir. Odak grup tartışmasında, bu karakterine tamamen uygun bir şekilde hareket etmeli ve konuşmalısın."""
+
+    def _retrieve(self, agenda_item: AgendaItem, discussion_log: List[dict],
+                  transcript_index: Optional[TranscriptIndex]) -> str:
+        """Gündem, son mesajlar ve personanın konularıyla en alakalı eski mesajları döndür"""
+        if transcript_index is None or not discussion_log:
+            return ""
+        query = " ".join(
+            [agenda_item.title] + [entry['message'] for entry in discussion_log[-2:]] + list(self.persona.topics or [])
+        )
+        hits = transcript_index.search(
+            query, k=self.retrieval_k, before_index=len(discussion_log) - self.retrieval_window
+        )
+        return "\n".join(
+            f"{entry['speaker']}: {truncate_to_tokens(entry['message'], 120)}" for _, _, entry in sorted(hits, key=lambda hit: hit[0])
+        )
+
+    def _agenda_line(self, agenda_item: AgendaItem) -> str:
+        memory_summary = agenda_item.persona_memories.get(self.persona.name, None)
+        if memory_summary:
+            return f"Şu anki gündem maddesi (senin hatırladığın kadarıyla): {memory_summary}"
+        return f"Şu anki gündem maddesi: {agenda_item.title} - {agenda_item.content}"
+
+    def _build_full_prompt(self, context: str, agenda_item: AgendaItem, discussion_log: List[dict] = None,
+                           transcript_index: Optional[TranscriptIndex] = None) -> str:
+        """Profil, özet + son mesajlar bağlamı ve geri getirilen eski mesajlarla tur istemi"""
+        memory_summary = agenda_item.persona_memories.get(self.persona.name, None)
+        retrieved = self._retrieve(agenda_item, discussion_log or [], transcript_index)
+        fitted = fit_prompt_sections('turn', [
+            PromptSection('profile', self._profile_block(), priority=5),
+            PromptSection('agenda', self._agenda_line(agenda_item), priority=4, max_tokens=800),
+            PromptSection('context', context, priority=3, keep='tail'),
+            PromptSection('retrieved', retrieved, priority=2, max_tokens=400),
+        ])
+        retrieved_block = f"\nDaha önce söylenenlerden ilgili olanlar:\n{fitted['retrieved']}\n" if fitted['retrieved'] else ""
+        return f"""{self._system_header()}
+
+{fitted['profile']}
+
+[TARTIŞMA BAĞLAMI]
+{retrieved_block}{fitted['context']}
+{fitted['agenda']}
+
+{self._instructions(bool(memory_summary))}"""
+
+    async def generate_response(self, context: str, agenda_item: AgendaItem, on_token: Optional[Callable] = None,
+                                discussion_log: Optional[List[dict]] = None,
+                                transcript_index: Optional[TranscriptIndex] = None) -> str:
+        """Persona yanıtını üret; on_token verilirse kısmi metin her yeni parçada bu callback'e iletilir
+
+        transcript_index ve discussion_log verilirse bağlam penceresinin dışında kalan en alakalı eski
+        mesajlar da isteme eklenir.
+        """
+        prompt = self._build_full_prompt(context, agenda_item, discussion_log, transcript_index)
+
+        # Konuşmalar önbelleğe yazılmaz; aynı gündem tekrar çalıştırıldığında yeni bir tartışma üretilir
+        if on_token is None:
+            return (await self.llm_client.call_llm(prompt, use_cache=False, call_type='turn')).strip()
+        partial = ""
+        async for chunk in self.llm_client.call_llm_stream(prompt, use_cache=False, call_type='turn'):
+            partial += chunk
+            await on_token(partial)
+        return partial.strip()
+
+
+MODERATOR_TRANSITION_TEMPLATES = [
+    "Teşekkürler. {next_persona}, sizin bu konudaki görüşünüz nedir?",
+    "Sözü şimdi {next_persona}'ya veriyorum.",
+    "Peki {next_persona}, siz bu konuya nasıl bakıyorsunuz?",
+    "Farklı bir bakış açısı duyalım. Buyurun {next_persona}.",
+    "{next_persona}, söylenenlere katılıyor musunuz?",
+    "Bu noktada {next_persona}'nın düşüncelerini merak ediyorum.",
+    "Teşekkür ederim. Sıra sizde {next_persona}.",
+    "{next_persona}, sizin deneyimleriniz bu konuda ne söylüyor?",
+]
+TRANSITION_PLACEHOLDER = "{isim}"
+
 
 class ModeratorAgent:
-    def __init__(self, llm_client: LLMClient):
+    """Odak grup moderatörü
+
+    Geçiş cümleleri transition_mode'a göre üretilir: 'template' yerel şablonlar, 'pool' oturum
+    başında tek toplu LLM çağrısıyla üretilen havuz, 'llm' her geçişte ayrı bir LLM çağrısı.
+    """
+
+    def __init__(self, llm_client: LLMClient, transition_mode: str = None):
         self.llm_client = llm_client
         self.conversation_history = []
+        self.transition_mode = (transition_mode or os.getenv('MODERATOR_TRANSITIONS', 'pool')).lower()
+        self.transition_pool: List[str] = []
+        self.rng = random.Random()
+        self._last_transition = None
+    
+    async def prepare_transitions(self, count: int = 12):
+        """'pool' modunda tek çağrıyla çeşitli geçiş cümleleri üret; başarısız olursa şablonlar kullanılır"""
+        self.transition_pool = []
+        if self.transition_mode != 'pool':
+            return
+        prompt = f"""[SİSTEM MESAJI]
+Sen bir "Odak Grup Moderatörü"sün. Tartışma boyunca sözü bir katılımcıdan diğerine verirken kullanacağın Geçiş Cümleleri hazırla.
+
+[TALİMATLAR]
+- Birbirinden farklı {count} kısa geçiş cümlesi yaz; tarafsız, nazik ve doğal olsun.
+- Her cümlede sözü alacak kişinin adı yerine tam olarak {TRANSITION_PLACEHOLDER} yaz.
+- Yanıtın sadece bir JSON dizisi olsun: ["...", "...", ...]. Başka hiçbir metin ekleme.
+"""
+        response = await self.llm_client.call_llm(prompt, use_cache=False, generation_config={
+            'response_mime_type': 'application/json'
+        }, call_type='moderator')
+        try:
+            candidates = json.loads(response)
+        except json.JSONDecodeError:
+            candidates = []
+        self.transition_pool = [
+            sentence.strip() for sentence in candidates
+            if isinstance(sentence, str) and sentence.count(TRANSITION_PLACEHOLDER) == 1
+        ] if isinstance(candidates, list) else []
+        if len(self.transition_pool) < 3:
+            logger.warning("Geçiş cümlesi havuzu üretilemedi, şablonlar kullanılacak")
+            self.transition_pool = []
+    
+    def reseed(self, seed: int):
+        self.rng.seed(seed)
+        self._last_transition = None
+    
+    def _local_transition(self, next_persona: str) -> str:
+        if self.transition_pool:
+            choices = [sentence.replace(TRANSITION_PLACEHOLDER, "{next_persona}") for sentence in self.transition_pool]
+        else:
+            choices = MODERATOR_TRANSITION_TEMPLATES
+        # Aynı cümle arka arkaya iki kez kullanılmasın
+        candidates = [choice for choice in choices if choice != self._last_transition] or choices
+        template = self.rng.choice(candidates)
+        self._last_transition = template
+        return template.replace("{next_persona}", next_persona)
     
     async def start_discussion(self, agenda_item: AgendaItem, first_persona: str) -> str:
+        fitted = fit_prompt_sections('moderator', [
+            PromptSection('title', agenda_item.title, priority=2, max_tokens=100),
+            PromptSection('content', agenda_item.content, priority=1, max_tokens=600),
+        ])
         prompt = f"""[SİSTEM MESAJI]
 Sen bir "Odak Grup Moderatörü"sün. Amacın, sana verilen gündem maddesi etrafında personalar arasında verimli ve adil bir tartışma ortamı sağlamaktır. Tarafsız kalmalı, tüm personalara eşit söz hakkı tanımalı ve tartışmanın belirlenen gündemden sapmamasını sağlamalısın.
 
 [GÜNDEM MADDESİ]
-Başlık: {agenda_item.title}
-İçerik: {agenda_item.content}
+Başlık: {fitted['title']}
+İçerik: {fitted['content']}
 
 Tartışmayı "Merhaba, bugün [{agenda_item.title}] konusunu konuşmak üzere toplandık. Bu konuda ilk sözü {first_persona}'ya vermek istiyorum." gibi bir cümleyle başlat.
 """
         
-        response = await self.llm_client.call_llm(prompt)
+        response = await self.llm_client.call_llm(prompt, use_cache=False, call_type='moderator')
         self.conversation_history.append({
             'timestamp': datetime.now(),
             'speaker': 'Moderatör',
@@ -351,9 +1838,19 @@ Tartışmayı "Merhaba, bugün [{agenda_item.title}] konusunu konuşmak üzere t
         return response
     
     async def give_turn(self, previous_persona: str, next_persona: str) -> str:
+        if self.transition_mode != 'llm':
+            response = self._local_transition(next_persona)
+            self.conversation_history.append({
+                'timestamp': datetime.now(),
+                'speaker': 'Moderatör',
+                'message': response
+            })
+            return response
+        
         prompt = f"""Sen moderatörsün. {previous_persona} konuştu, şimdi sırayı {next_persona}'ya ver. Kısa ve öz bir geçiş cümlesi söyle."""
         
-        response = await self.llm_client.call_llm(prompt)
+        # Aynı istem her turda tekrarlandığı için önbellek kullanılmaz, aksi halde hep aynı cümle döner
+        response = await self.llm_client.call_llm(prompt, use_cache=False, call_type='moderator')
         self.conversation_history.append({
             'timestamp': datetime.now(),
             'speaker': 'Moderatör',
@@ -361,34 +1858,36 @@ Tartışmayı "Merhaba, bugün [{agenda_item.title}] konusunu konuşmak üzere t
         })
         return response
 
+def fit_analysis_sections(full_discussion: str, personas: List[Persona], agenda_items: List[AgendaItem]) -> Dict[str, str]:
+    """Analiz istemlerinin katılımcı, gündem ve transkript bölümlerini 'analysis' bütçesine sığdır"""
+    persona_info = "".join(f"- {persona.name}: {persona.role}, {persona.personality}\n" for persona in personas or [])
+    agenda_info = "".join(f"{i}. {item.title}\n" for i, item in enumerate(agenda_items or [], 1))
+    # Transkript bütçeyi aşarsa baştan ve sondan korunur, ortası çıkarılır
+    return fit_prompt_sections('analysis', [
+        PromptSection('personas', persona_info, priority=3),
+        PromptSection('agenda', agenda_info, priority=2, max_tokens=2000),
+        PromptSection('transcript', full_discussion, priority=1, min_tokens=4000, keep='middle'),
+    ])
+
+
 class OverseerAgent:
     def __init__(self, llm_client: LLMClient):
         self.llm_client = llm_client
     
     async def analyze_discussion(self, full_discussion: str, personas: List[Persona], agenda_items: List[AgendaItem]) -> str:
-        # Prepare persona info
-        persona_info = ""
-        if personas:
-            for persona in personas:
-                persona_info += f"- {persona.name}: {persona.role}, {persona.personality}\n"
-        
-        # Prepare agenda info
-        agenda_info = ""
-        if agenda_items:
-            for i, item in enumerate(agenda_items, 1):
-                agenda_info += f"{i}. {item.title}\n"
+        fitted = fit_analysis_sections(full_discussion, personas, agenda_items)
         
         prompt = f"""[SİSTEM MESAJI]
 Sen "Prof. Dr. Araştırmacı" - sosyoloji ve siyaset bilimi alanında uzmanlaşmış bir akademisyensin. Sana bir odak grup tartışmasının tam transkripti verilecek. Bu tartışmayı derinlemesine analiz et.
 
 [KATILIMCILAR]
-{persona_info}
+{fitted['personas']}
 
 [TARTIŞILAN KONULAR]
-{agenda_info}
+{fitted['agenda']}
 
 [TARTIŞMA TRANSKRİPTİ]
-{full_discussion}
+{fitted['transcript']}
 
 [ARAŞTIRMA RAPORU TALİMATLARI]
 Kapsamlı bir akademik analiz raporu hazırla:
@@ -439,12 +1938,472 @@ Kapsamlı bir akademik analiz raporu hazırla:
 Objektif, bilimsel ve eleştirel bir yaklaşım sergile. Somut örneklerle destekle.
 """
         
-        analysis = await self.llm_client.call_llm(prompt)
+        analysis = await self.llm_client.call_llm(prompt, call_type='analysis')
         return analysis
 
+class ConversationMemory:
+    """Tartışma için katmanlı, kayan hafıza
+
+    Son recent_turns mesaj aynen tutulur; daha eski persona mesajları arka planda gündem maddesi başına
+    bir özete katlanır (moderatör cümleleri özete girmez), biten maddelerin özetleri de oturum özetine
+    eklenir. Katlama fold_batch persona mesajı biriktiğinde ya da bir madde bittiğinde başlar; böylece
+    özet çağrıları konuşmalarla anahtar kotası için yarışmaz. Katlama ayrı bir task'ta
+    çalışır, konuşma sırasını hiç bekletmez; özet geride kalırsa katlanmamış mesajlar bağlamda
+    ham olarak yer alır. deterministic=True iken katlama sadece settle() çağrılarında başlatılır ve
+    bir sonraki settle()'da beklenir; bağlam LLM gecikmelerine değil sadece konuşma sırasına bağlı olur.
+    """
+
+    def __init__(self, llm_client: LLMClient, recent_turns: int = 6, fold_batch: int = 8,
+                 context_token_budget: int = 1500, deterministic: bool = False):
+        self.llm_client = llm_client
+        self.recent_turns = recent_turns
+        self.fold_batch = fold_batch
+        self.context_token_budget = context_token_budget
+        self.deterministic = deterministic
+        self.reset()
+
+    def reset(self):
+        if getattr(self, '_fold_task', None) is not None and not self._fold_task.done():
+            self._fold_task.cancel()
+        self.entries: List[dict] = []
+        self.entry_items: List[str] = []
+        self.folded_index = 0
+        self.item_summaries: Dict[str, str] = {}
+        self.session_summary = ""
+        self.session_items: List[str] = []
+        self.fold_count = 0
+        self._fold_task: Optional[asyncio.Task] = None
+
+    def observe(self, entry: dict, agenda_item: AgendaItem):
+        """discussion_log'a eklenen her mesajdan sonra çağrılır; gerekirse arka planda katlama başlatır"""
+        self.entries.append(entry)
+        self.entry_items.append(agenda_item.title)
+        if self.deterministic:
+            return
+        if self._fold_due() and (self._fold_task is None or self._fold_task.done()):
+            self._fold_task = asyncio.create_task(self._fold(len(self.entries) - self.recent_turns))
+
+    def _fold_due(self) -> bool:
+        cutoff = len(self.entries) - self.recent_turns
+        if cutoff <= self.folded_index:
+            return False
+        pending = self.entries[self.folded_index:cutoff]
+        if sum(1 for entry in pending if message_kind(entry) == 'persona') >= self.fold_batch:
+            return True
+        # Katlanmamış en eski madde bittiyse beklemeden katlanır: madde başına bir özet çağrısı
+        return cutoff < len(self.entry_items) and self.entry_items[self.folded_index] != self.entry_items[cutoff]
+
+    async def settle(self):
+        """Deterministik modda önceki katlamayı bekle ve gerekiyorsa yenisini başlat (diğer modda no-op)"""
+        if not self.deterministic:
+            return
+        if self._fold_task is not None:
+            await self._fold_task
+        if self._fold_due():
+            self._fold_task = asyncio.create_task(self._fold(len(self.entries) - self.recent_turns))
+
+    async def _fold(self, cutoff: int):
+        try:
+            start = self.folded_index
+            while start < cutoff:
+                title = self.entry_items[start]
+                end = start
+                while end < cutoff and self.entry_items[end] == title:
+                    end += 1
+                finished = end < len(self.entry_items) and self.entry_items[end] != title
+                turns = [entry for entry in self.entries[start:end] if message_kind(entry) == 'persona']
+                if not finished and len(turns) < self.fold_batch:
+                    # Süren maddenin birkaç yeni mesajı için ayrı bir özet çağrısı yapılmaz
+                    break
+                if turns:
+                    summary = await self._summarize(
+                        f"Gündem maddesi: {title}", self.item_summaries.get(title, ""), turns
+                    )
+                    if summary is None:
+                        return
+                    self.item_summaries[title] = summary
+                self.folded_index = end
+                # Sonraki mesajlar başka bir maddeye aitse bu madde bitmiştir, oturum özetine ekle
+                if finished and title in self.item_summaries:
+                    await self._fold_session(title)
+                start = end
+            self.fold_count += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Hafıza katlama hatası: {e}")
+
+    async def _fold_session(self, title: str):
+        lines = [{'speaker': 'Özet', 'message': f"{title}: {self.item_summaries[title]}"}]
+        summary = await self._summarize("Oturumun tamamı", self.session_summary, lines)
+        if summary is not None:
+            self.session_summary = summary
+            if title not in self.session_items:
+                self.session_items.append(title)
+
+    async def _summarize(self, scope: str, previous: str, entries: List[dict]) -> Optional[str]:
+        transcript = "\n".join(f"{entry['speaker']}: {entry['message']}" for entry in entries)
+        prompt = f"""[SİSTEM MESAJI]
+Sen bir "Tartışma Özetleyicisi"sin. Bir odak grup tartışmasının mevcut özetini yeni mesajlarla güncelleyeceksin.
+
+[KAPSAM]
+{scope}
+
+[MEVCUT ÖZET]
+{previous or "(henüz yok)"}
+
+[YENİ MESAJLAR]
+{transcript}
+
+[TALİMATLAR]
+- Mevcut özeti yeni mesajlarla birleştirip güncellenmiş tek bir özet yaz.
+- Kimin hangi görüşü savunduğunu, önemli argümanları ve anlaşmazlıkları koru.
+- En fazla 120 kelime kullan. Sadece özeti yaz.
+"""
+        response = await self.llm_client.call_llm(prompt, use_cache=False, generation_config={'max_output_tokens': 512},
+                                                  call_type='summary')
+        if not response or response in LLM_FALLBACK_MESSAGES:
+            logger.warning(f"Özet güncellenemedi ({scope}), bir sonraki katlamada tekrar denenecek")
+            return None
+        return response.strip()
+
+    def summary_text(self, agenda_item: AgendaItem = None) -> str:
+        parts = []
+        if self.session_summary:
+            parts.append(f"Önceki maddeler: {self.session_summary}")
+        if agenda_item is not None and self.item_summaries.get(agenda_item.title):
+            parts.append(f"Bu madde şimdiye kadar: {self.item_summaries[agenda_item.title]}")
+        return "\n".join(parts)
+
+    def build_context(self, agenda_item: AgendaItem = None, token_budget: int = None) -> str:
+        """Özet + son mesajlar; bütçe aşılırsa önce özet, sonra en eski mesajlar kısaltılır"""
+        recent = "\n".join(f"{entry['speaker']}: {entry['message']}" for entry in self.entries[self.folded_index:])
+        fitted = fit_prompt_sections('context', [
+            PromptSection('summary', self.summary_text(agenda_item), priority=1, min_tokens=150),
+            PromptSection('recent', recent, priority=2, keep='tail'),
+        ], token_budget=token_budget or self.context_token_budget)
+        parts = []
+        if fitted['summary']:
+            parts.append(f"[ÖZET]\n{fitted['summary']}")
+        if fitted['recent']:
+            parts.append(f"[SON MESAJLAR]\n{fitted['recent']}")
+        return "\n\n".join(parts)
+
+    async def aclose(self):
+        """Bekleyen katlamayı iptal et"""
+        if self._fold_task is not None and not self._fold_task.done():
+            self._fold_task.cancel()
+            try:
+                await self._fold_task
+            except asyncio.CancelledError:
+                pass
+
+# Tiyatral gösterimde mesaj türüne göre sonraki mesajdan önceki bekleme (saniye)
+THEATRICAL_PAUSES = {'moderator': 2.0, 'persona': 3.0}
+
+
+def message_kind(entry: dict) -> str:
+    return 'moderator' if entry['speaker'] == 'Moderatör' else 'persona'
+
+
+class PacingPolicy:
+    """Üretim sırasında mesajlar arası bekleme politikası; 'fast' hiç beklemez"""
+    name = 'fast'
+
+    def delay(self, kind: str) -> float:
+        return 0.0
+
+    async def pause(self, kind: str):
+        return
+
+
+class TheatricalPacing(PacingPolicy):
+    """Eski davranış: her mesajdan sonra THEATRICAL_PAUSES kadar bekle (speed ile ölçeklenir)"""
+    name = 'theatrical'
+
+    def __init__(self, speed: float = 1.0, pauses: Dict[str, float] = None):
+        self.speed = speed
+        self.pauses = pauses or dict(THEATRICAL_PAUSES)
+
+    def delay(self, kind: str) -> float:
+        return self.pauses.get(kind, 0) / self.speed
+
+    async def pause(self, kind: str):
+        delay = self.delay(kind)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def create_pacing(name: str = None, speed: float = None) -> PacingPolicy:
+    """SIMULATION_PACING ('fast' | 'theatrical') ve SIMULATION_PACING_SPEED ortam değişkenlerinden politika"""
+    name = (name or os.getenv('SIMULATION_PACING', 'fast')).lower()
+    if name == 'theatrical':
+        return TheatricalPacing(speed=speed or float(os.getenv('SIMULATION_PACING_SPEED', 1.0)))
+    if name != 'fast':
+        raise ValueError(f"Unknown pacing policy: {name}")
+    return PacingPolicy()
+
+
+class TranscriptPlayback:
+    """Hızla üretilmiş transkripti zaman damgalarına göre tiyatral hızda açan oynatma katmanı
+
+    Her mesaj, üretildiği andan ve bir önceki mesajın açılmasından sonraki bekleme süresinden
+    (pauses / speed) hangisi daha geçse o anda görünür olur. speed=0 her şeyi anında gösterir.
+    """
+
+    def __init__(self, speed: float = 1.0, pauses: Dict[str, float] = None):
+        self.speed = speed
+        self.pauses = pauses or dict(THEATRICAL_PAUSES)
+
+    def reveal_times(self, discussion_log: List[dict]) -> List[datetime]:
+        times = []
+        for index, entry in enumerate(discussion_log):
+            reveal = entry['timestamp']
+            if times and self.speed:
+                delay = self.pauses.get(message_kind(discussion_log[index - 1]), 0) / self.speed
+                reveal = max(reveal, times[-1] + timedelta(seconds=delay))
+            times.append(reveal)
+        return times
+
+    def visible_count(self, discussion_log: List[dict], now: datetime = None) -> int:
+        if not self.speed:
+            return len(discussion_log)
+        now = now or datetime.now()
+        return sum(1 for reveal in self.reveal_times(discussion_log) if reveal <= now)
+
+    def is_done(self, discussion_log: List[dict], now: datetime = None) -> bool:
+        return self.visible_count(discussion_log, now) >= len(discussion_log)
+
+
+# Gecikme tahminlerinin ilk değerleri (saniye); ilk gerçek çağrılardan sonra EWMA ile güncellenir
+LATENCY_PRIORS = {'turn': 6.0, 'moderator': 3.0}
+
+
+@dataclass
+class DiscussionPlan:
+    items: List[AgendaItem]
+    rounds: int
+    speakers: int
+
+
+class DeadlineScheduler:
+    """Tartışma süresini çevrimiçi öğrenilen LLM gecikmeleriyle planlayan zamanlayıcı
+
+    Gecikmeler LLMClient.call_records'tan çağrı türü başına EWMA ile öğrenilir (önbellek isabetleri
+    de dahil, koşunun gerçek maliyeti odur); henüz görülmemiş bir tür için tüm çağrıların EWMA'sı,
+    o da yoksa LATENCY_PRIORS kullanılır. plan() kaç madde/tur/konuşmacının sığacağını hesaplar; tartışma sırasında fits()
+    sığmayacak konuşmaları atlatır, remaining() süren çağrıların zaman aşımı olarak kullanılır.
+    """
+
+    def __init__(self, llm_client: LLMClient, duration_seconds: float, pacing: PacingPolicy = None,
+                 llm_transitions: bool = False, alpha: float = 0.3, safety: float = 1.2):
+        self.llm_client = llm_client
+        self.pacing = pacing or PacingPolicy()
+        self.llm_transitions = llm_transitions
+        self.alpha = alpha
+        self.safety = safety
+        self.deadline = time.monotonic() + duration_seconds
+        self.estimates: Dict[str, float] = {}
+        self.overall: Optional[float] = None
+        self._seen_until = 0.0
+        self.observe()
+
+    def observe(self):
+        """call_records'taki yeni başarılı çağrılarla tahminleri güncelle"""
+        latest = self._seen_until
+        for record in list(self.llm_client.call_records):
+            if record.finished_at <= self._seen_until or not record.success:
+                continue
+            latest = max(latest, record.finished_at)
+            self.estimates[record.call_type] = self._ewma(self.estimates.get(record.call_type), record.latency)
+            self.overall = self._ewma(self.overall, record.latency)
+        self._seen_until = latest
+
+    def _ewma(self, previous: Optional[float], value: float) -> float:
+        return value if previous is None else self.alpha * value + (1 - self.alpha) * previous
+
+    def estimate(self, call_type: str) -> float:
+        if call_type in self.estimates:
+            return self.estimates[call_type]
+        return self.overall if self.overall is not None else LATENCY_PRIORS.get(call_type, 3.0)
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def speaker_cost(self) -> float:
+        """Bir persona konuşmasının beklenen süresi (LLM geçişi önceki konuşma sırasında üretilir)"""
+        transition = self.estimate('moderator') if self.llm_transitions else 0.0
+        # Tamamen önbellekten dönen koşularda tahmin 0 olabilir; bölmeler için alt sınır
+        return max(0.01, max(self.estimate('turn'), transition) + self.pacing.delay('persona'))
+
+    def overhead(self) -> float:
+        """Bir maddenin konuşmacı dışı maliyeti: moderatör girişi ve giriş/kapanış beklemeleri"""
+        return self.estimate('moderator') + 2 * self.pacing.delay('moderator')
+
+    def step_cost(self, speakers: int) -> float:
+        return self.overhead() + speakers * self.speaker_cost()
+
+    def fits(self, seconds: float) -> bool:
+        return seconds * self.safety <= self.remaining()
+
+    def speakers_fitting(self, limit: int) -> int:
+        """Kalan sürede bu maddede konuşabilecek kişi sayısı (en fazla limit)"""
+        self.observe()
+        budget = self.remaining() / self.safety - self.overhead()
+        return max(0, min(limit, int(budget // self.speaker_cost())))
+
+    def plan(self, items: List[AgendaItem], agent_count: int, max_rounds: int, min_speakers: int = 2) -> DiscussionPlan:
+        """Önce tüm maddeler (gerekirse daha az konuşmacıyla), sonra sığdığı kadar ek tur"""
+        self.observe()
+        if not items:
+            return DiscussionPlan([], 0, agent_count)
+        budget = self.remaining() / self.safety
+        round_cost = len(items) * self.step_cost(agent_count)
+        if round_cost <= budget:
+            rounds = max(1, min(max_rounds, int(budget // round_cost)))
+            return DiscussionPlan(list(items), rounds, agent_count)
+        
+        speakers = min(agent_count, max(min_speakers, int(
+            (budget / len(items) - self.overhead()) // self.speaker_cost()
+        )))
+        item_count = max(1, min(len(items), int(budget // self.step_cost(speakers))))
+        if item_count < len(items):
+            # Sığmayan maddeler atlanır; personaların en çok ilgilendiği maddeler önce gelir
+            keep = set(id(item) for item in sorted(items, key=lambda item: item.score, reverse=True)[:item_count])
+            items = [item for item in items if id(item) in keep]
+        return DiscussionPlan(list(items), 1, speakers)
+
+
+class SimulationJournal:
+    """Append-only JSONL kontrol noktası günlüğü
+
+    Tamamlanan her puan/hafıza, konuşmacı sırası ve konuşma anında tek satır olarak yazılır ve
+    diske flush edilir; böylece çökme ya da yeniden dağıtımda ödenmiş LLM çağrıları kaybolmaz.
+    Yarım kalmış son satır (yazma sırasında çökme) okunurken atlanır.
+    """
+
+    def __init__(self, path: str, fsync: bool = True, truncate: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'w' if truncate else 'a', encoding='utf-8')
+
+    def append(self, kind: str, **data):
+        record = {'kind': kind, 'at': datetime.now().isoformat(), **data}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._file.write(line + "\n")
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except OSError as e:
+                logger.error(f"Journal write failed ({self.path}): {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def read(path: str) -> List[dict]:
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping unreadable journal line in {path}")
+        return records
+
+    @staticmethod
+    def is_finished(path: str, tail_bytes: int = 4096) -> bool:
+        """Son kayıt 'finished' mı; dosyanın tamamı değil yalnızca sonu okunur"""
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - tail_bytes))
+            lines = f.read().splitlines()
+        # 'finished' kısa bir satırdır; son satır okunamıyorsa (yarım yazma) koşu bitmemiştir
+        last = next((line for line in reversed(lines) if line.strip()), b'')
+        try:
+            record = json.loads(last)
+        except ValueError:
+            return False
+        return isinstance(record, dict) and record.get('kind') == 'finished'
+
+
+def list_unfinished_journals(journal_dir: str, exclude: set = None) -> List[str]:
+    """Sürdürülebilecek (bitmemiş) günlük dosyaları, en yenisi önce
+
+    exclude: hâlâ yazılan günlükler (bkz. SimulationJobManager.active_journals); bunlar
+    listelenmez, böylece ikinci bir oturum canlı bir günlüğü sürdürüp aynı dosyaya yazamaz.
+    """
+    if not journal_dir or not os.path.isdir(journal_dir):
+        return []
+    exclude = {os.path.abspath(path) for path in exclude or ()}
+    paths = [os.path.join(journal_dir, name) for name in os.listdir(journal_dir)
+             if name.endswith('.jsonl') and os.path.abspath(os.path.join(journal_dir, name)) not in exclude]
+    unfinished = []
+    for path in paths:
+        try:
+            if not SimulationJournal.is_finished(path):
+                unfinished.append((os.path.getmtime(path), path))
+        except OSError as e:
+            logger.warning(f"Journal could not be checked ({path}): {e}")
+    return [path for _, path in sorted(unfinished, reverse=True)]
+
+
+@dataclass
+class SimulationEvent:
+    seq: int
+    kind: str  # status (iş durumu/aşaması)
+    data: dict
+    timestamp: float = field(default_factory=time.time)
+
+
+class SimulationEventBus:
+    """Simülasyon olaylarının sıralı, sınırlı günlüğü
+
+    Yayıncı (simülasyon loop'u) publish() ile ekler; okuyucular kendi cursor'larını tutar ve
+    read(cursor) ile yalnızca yeni olayları alır. Sıra numaraları simülatör ömrü boyunca artar,
+    bu yüzden yeni bir koşu eski cursor'ları geçersiz kılmaz.
+    """
+
+    def __init__(self, max_events: int = 5000):
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def publish(self, kind: str, **data) -> SimulationEvent:
+        with self._lock:
+            self._seq += 1
+            event = SimulationEvent(seq=self._seq, kind=kind, data=data)
+            self._events.append(event)
+        return event
+
+    def read(self, cursor: int = 0) -> Tuple[List[SimulationEvent], int]:
+        """cursor'dan sonraki olaylar ve yeni cursor (tutulmayacak kadar eski olaylar atlanır)"""
+        with self._lock:
+            events = [event for event in self._events if event.seq > cursor]
+            latest = self._seq
+        return events, latest
+
+
 class FocusGroupSimulator:
-    def __init__(self):
-        self.llm_client = LLMClient()
+    def __init__(self, llm_client: LLMClient = None, pacing: PacingPolicy = None, persona_dir: str = None,
+                 seed: int = None):
+        self.llm_client = llm_client or LLMClient()
+        # Tohum verilirse konuşmacı sırası, kapanış ve geçiş cümleleri ile hafıza katlaması tekrarlanabilir olur
+        if seed is None and os.getenv('SIMULATION_SEED'):
+            seed = int(os.getenv('SIMULATION_SEED'))
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.persona_dir = persona_dir
+        self.pacing = pacing or create_pacing()
         self.mcp_agent = MCPThinkingAgent(self.llm_client, self)
         self.moderator = ModeratorAgent(self.llm_client)
         self.overseer = OverseerAgent(self.llm_client)
@@ -456,17 +2415,32 @@ class FocusGroupSimulator:
         self.is_running = False
         self.memory = {}
         self.mcp_logs = []
+        self.preparation_concurrency = 4
+        # 'fused': puan + hafıza tek çağrı, 'batch': persona başına toplu puan + ayrı hafıza, 'separate': eski davranış
+        self.preparation_mode = 'fused'
+        self.partial_message = None
+        self.discussion_plan: Optional[DiscussionPlan] = None
+        self.conversation_memory = ConversationMemory(self.llm_client, deterministic=seed is not None)
+        self.transcript_index = TranscriptIndex()
+        self.events = SimulationEventBus()
+        self.journal: Optional[SimulationJournal] = None
+        self._reset_resume_state()
         
         self.load_personas()
         os.makedirs("personas_pp", exist_ok=True)
     
     def load_personas(self):
-        persona_files = [
-            'personas/elif.json',
-            'personas/hatice_teyze.json',
-            'personas/kenan_bey.json',
-            'personas/tugrul_bey.json'
-        ]
+        if self.persona_dir:
+            persona_files = sorted(
+                os.path.join(self.persona_dir, name) for name in os.listdir(self.persona_dir) if name.endswith('.json')
+            )
+        else:
+            persona_files = [
+                'personas/elif.json',
+                'personas/hatice_teyze.json',
+                'personas/kenan_bey.json',
+                'personas/tugrul_bey.json'
+            ]
         
         for file_path in persona_files:
             if os.path.exists(file_path):
@@ -475,7 +2449,8 @@ class FocusGroupSimulator:
                     self.personas.append(persona)
                     agent = FocusGroupAgent(persona, self.llm_client, self.mcp_agent)
                     self.agents.append(agent)
-                    logger.info(f"Loaded persona: {persona.name}")
+                    sizes = ", ".join(f"{kind} {block.tokens}" for kind, block in persona.renderings.items())
+                    logger.info(f"Loaded persona: {persona.name} (profil token: {sizes})")
                 except Exception as e:
                     logger.error(f"Failed to load persona from {file_path}: {e}")
     
@@ -514,6 +2489,7 @@ class FocusGroupSimulator:
                 logger.error("No valid agenda items found in file")
                 return False
 
+            self._reset_resume_state()
             logger.info(f"Successfully loaded {len(self.agenda_items)} agenda items")
             return True
 
@@ -521,126 +2497,395 @@ class FocusGroupSimulator:
             logger.error(f"Failed to load agenda data: {str(e)}")
             return False
     
-    async def prepare_agenda_analysis(self):
-        """Gündem maddelerini analiz et ve puanları hesapla"""
-        await self.score_agenda_items()
+    def _reset_resume_state(self):
+        self._resumed_pairs = set()  # (madde sırası, persona) - hazırlığı günlükte tamamlanmış
+        self._resume_slots = set()  # (adım, slot) - tartışmada günlüğe yazılmış mesajlar
+        self._resume_orders = {}  # adım -> konuşmacı sırası
+        self._resume_steps = []  # discussion_log ile aynı sırada her mesajın adımı
+        self._resume_items = None  # sürdürülen koşunun planındaki madde sıraları
     
-    async def score_agenda_items(self):
-        """Score all agenda items for all personas"""
+    async def _journal(self, kind: str, **data):
+        # fsync paylaşılan event loop'u bekletmesin; kayıt yine de devam etmeden önce diske yazılır
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.append, kind, **data)
+    
+    def open_journal(self, path: str):
+        """Yeni bir kontrol noktası günlüğü başlat; gündem ve personalar başlık kaydı olarak yazılır"""
+        self.close_journal()
+        self.journal = SimulationJournal(path, truncate=True)
+        self.journal.append('agenda', personas=[persona.name for persona in self.personas], items=[
+            {'type': item.type, 'link': item.link, 'title': item.title, 'content': item.content,
+             'comments': item.comments}
+            for item in self.agenda_items
+        ])
+    
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+    
+    def resume_from_journal(self, path: str) -> bool:
+        """Gündemi, hazırlık sonuçlarını ve transkripti günlükten geri yükle
+
+        Sonraki prepare_agenda_analysis() ve start_simulation() çağrıları günlükte tamamlanmış
+        puan/hafıza ve konuşmaları atlar; yeni kayıtlar aynı günlüğe eklenmeye devam eder.
+        """
+        try:
+            records = SimulationJournal.read(path)
+        except OSError as e:
+            logger.error(f"Failed to read journal {path}: {e}")
+            return False
+        header = next((record for record in records if record.get('kind') == 'agenda'), None)
+        if header is None:
+            logger.error(f"Journal has no agenda record: {path}")
+            return False
+        
+        self.close_journal()
+        self._reset_resume_state()
+        self.agenda_items = [AgendaItem(**fields) for fields in header['items']]
+        self.memory = {}
+        turns = []
+        for record in records:
+            kind = record.get('kind')
+            if kind == 'prepared' and record['item'] < len(self.agenda_items):
+                item = self.agenda_items[record['item']]
+                item.persona_scores[record['persona']] = record['score']
+                item.persona_memories[record['persona']] = record['memory']
+                self.memory[(record['persona'], item.title)] = record['memory']
+                self._resumed_pairs.add((record['item'], record['persona']))
+            elif kind == 'start' and not record.get('resumed'):
+                # Baştan başlatılan bir koşu önceki tartışma kayıtlarını geçersiz kılar
+                turns, self._resume_slots, self._resume_orders = [], set(), {}
+                self._resume_items = record.get('items')
+            elif kind == 'plan':
+                self._resume_items = record['items']
+            elif kind == 'order':
+                self._resume_orders[record['step']] = record['speakers']
+            elif kind == 'turn':
+                self._resume_slots.add((record['step'], record['slot']))
+                turns.append(record)
+        
         for item in self.agenda_items:
-            scores = []
-            for persona in self.personas:
-                score = await self.mcp_agent.score_agenda_item(persona, item)
-                scores.append(score)
-                # Store individual scores
+            if item.persona_scores:
+                item.score = sum(item.persona_scores.values()) / len(item.persona_scores)
+        self.discussion_log = [
+            {'timestamp': datetime.fromisoformat(turn['timestamp']), 'speaker': turn['speaker'],
+             'message': turn['message']}
+            for turn in turns
+        ]
+        self._resume_steps = [turn['step'] for turn in turns]
+        self.journal = SimulationJournal(path)
+        logger.info(f"Resumed from journal {path}: {len(self._resumed_pairs)} prepared pairs, {len(turns)} messages")
+        return True
+    
+    async def prepare_agenda_analysis(self, on_progress: Optional[Callable] = None):
+        """Gündem maddelerini analiz et ve puanları hesapla"""
+        await self.score_agenda_items(on_progress=on_progress)
+    
+    async def score_agenda_items(self, on_progress: Optional[Callable] = None, max_concurrency: Optional[int] = None):
+        """Score all agenda items for all personas, running persona/item pairs concurrently"""
+        semaphore = asyncio.Semaphore(max_concurrency or self.preparation_concurrency)
+        total_items = len(self.agenda_items)
+        completed_items = 0
+        batch_scores = {}
+        
+        if self.preparation_mode == 'batch':
+            # Her persona için tüm gündem tek (ya da birkaç) istekte puanlanır
+            async def score_persona(persona: Persona):
+                if all((index, persona.name) in self._resumed_pairs for index in range(total_items)):
+                    return [item.persona_scores[persona.name] for item in self.agenda_items]
+                async with semaphore:
+                    return await self.mcp_agent.score_agenda_items_batch(persona, self.agenda_items)
+            
+            persona_scores = await asyncio.gather(*(score_persona(persona) for persona in self.personas))
+            for persona, scores in zip(self.personas, persona_scores):
+                for item, score in zip(self.agenda_items, scores):
+                    batch_scores[(persona.name, id(item))] = score
+        
+        async def prepare_pair(index: int, item: AgendaItem, persona: Persona):
+            if (index, persona.name) in self._resumed_pairs:
+                return item.persona_scores[persona.name], item.persona_memories[persona.name]
+            async with semaphore:
+                if self.preparation_mode == 'fused':
+                    score, summary = await self.mcp_agent.score_and_remember(persona, item)
+                else:
+                    score = batch_scores.get((persona.name, id(item)))
+                    if score is None:
+                        score = await self.mcp_agent.score_agenda_item(persona, item)
+                    # Create memory summary
+                    summary = await self.mcp_agent.summarize_for_persona(persona, item, score)
+            await self._journal('prepared', item=index, persona=persona.name, score=score, memory=summary)
+            return score, summary
+        
+        async def prepare_item(index: int, item: AgendaItem):
+            nonlocal completed_items
+            results = await asyncio.gather(*(prepare_pair(index, item, persona) for persona in self.personas))
+            # Sonuçlar tamamlanma sırasına değil persona sırasına göre yazılır
+            for persona, (score, summary) in zip(self.personas, results):
                 item.persona_scores[persona.name] = score
-                # Create memory summary
-                summary = await self.mcp_agent.summarize_for_persona(persona, item, score)
                 item.persona_memories[persona.name] = summary
                 # Also store in old memory format for backward compatibility
                 self.memory[(persona.name, item.title)] = summary
-            item.score = sum(scores) / len(scores)  # Average score
+            scores = [score for score, _ in results]
+            item.score = sum(scores) / len(scores) if scores else 0.0  # Average score
+            completed_items += 1
+            if on_progress:
+                await on_progress(completed_items, total_items, item)
+        
+        await asyncio.gather(*(prepare_item(index, item) for index, item in enumerate(self.agenda_items)))
     
-    async def start_simulation(self, max_rounds=3, on_new_message: Optional[Callable] = None):
-        """Start the focus group simulation"""
+    async def start_simulation(self, max_rounds=3, duration_seconds: float = None):
+        """Start the focus group simulation
+
+        Progress is published on self.events: a 'partial' event per streamed chunk of a persona
+        reply, a 'message' event once an entry is appended to discussion_log. Gaps between
+        messages come from self.pacing; the default 'fast' policy never sleeps and leaves
+        theatrical timing to TranscriptPlayback on the UI side.
+
+        With a journal open every message is checkpointed; after resume_from_journal() the
+        messages already in the journal are restored instead of being generated again.
+
+        With duration_seconds a DeadlineScheduler plans how many items, rounds (up to max_rounds)
+        and speakers fit, skips turns that would not finish in time and cancels the call in
+        flight when the deadline passes. Without it every item runs max_rounds times.
+        """
         if not self.agenda_items:
             raise ValueError("No agenda items loaded")
         
         self.is_running = True
-        self.discussion_log = []
-        round_count = 0
+        self.discussion_plan = None
+        scheduler = None
+        if duration_seconds:
+            scheduler = DeadlineScheduler(self.llm_client, duration_seconds, self.pacing,
+                                          llm_transitions=self.moderator.transition_mode == 'llm')
+        self.conversation_memory.reset()
+        self.transcript_index.reset()
+        if self.seed is not None:
+            self.rng.seed(self.seed)
+            self.moderator.reseed(self.seed)
+        await self.moderator.prepare_transitions()
+        end_comments = [
+            "Teşekkürler, bu konuda çok değerli görüşler ortaya çıktı.",
+            "Farklı bakış açıları ile zengin bir tartışma oldu.",
+            "Bu konudaki görüşleriniz için hepinize teşekkür ederim."
+        ]
+        
+        # Sürdürülen oturum kendi planındaki maddelerle devam eder
+        items = self.agenda_items
+        if self._resume_items is not None:
+            items = [self.agenda_items[index] for index in self._resume_items if index < len(self.agenda_items)]
+            if not items:
+                logger.warning("Günlükteki plan maddeleri gündemle eşleşmiyor, tüm maddelerle devam ediliyor")
+                items = self.agenda_items
+        plan = DiscussionPlan(list(items), max_rounds, len(self.agents))
+        if scheduler is not None:
+            plan = scheduler.plan(items, len(self.agents), max_rounds)
+            if self._resume_items is not None:
+                plan.items = list(items)
+            logger.info(f"Tartışma planı: {len(plan.items)}/{len(self.agenda_items)} madde, {plan.rounds} tur, "
+                        f"madde başına {plan.speakers} konuşmacı (konuşma tahmini {scheduler.speaker_cost():.1f} sn)")
+        self.discussion_plan = plan
         
-        import random
+        # Gündem maddeleri tur tur sıralanır; böylece bir sonraki maddenin girişi önceden başlatılabilir
+        schedule = [agenda_item for _ in range(plan.rounds) for agenda_item in plan.items]
+        first_persona = self.personas[0].name if self.personas else "katılımcı"
+        intro_task = None
+        pending = set()
+        done = self._resume_slots
         
-        while self.is_running and round_count < max_rounds:
-            for agenda_item in self.agenda_items:
+        # Günlükten geri yüklenen mesajlar hafızaya ve arama dizinine yeniden işlenir
+        restored = self.discussion_log if self._resume_steps else []
+        self.discussion_log = []
+        for entry, step in zip(restored, self._resume_steps):
+            self.discussion_log.append(entry)
+            self.conversation_memory.observe(entry, plan.items[step % len(plan.items)])
+            self.transcript_index.add(entry)
+        item_indices = {id(item): index for index, item in enumerate(self.agenda_items)}
+        await self._journal('start', max_rounds=max_rounds, resumed=bool(done),
+                      items=[item_indices[id(item)] for item in plan.items])
+        
+        try:
+            for step, agenda_item in enumerate(schedule):
                 if not self.is_running:
                     break
                 
-                # Moderatör girişi
-                first_persona = self.personas[0].name if self.personas else "katılımcı"
-                moderator_intro = await self.moderator.start_discussion(agenda_item, first_persona)
-                self.discussion_log.append({
-                    'timestamp': datetime.now(),
-                    'speaker': 'Moderatör',
-                    'message': moderator_intro
-                })
-                
-                if on_new_message:
-                    await on_new_message()
-                
-                await asyncio.sleep(2)
-                
-                # Her persona konuşsun (random sırayla)
+                # Her persona konuşsun (random sırayla); ilk geçiş cümlesi giriş ile paralel başlar.
+                # Sıra ve kapanış her adımda (atlanan adımlarda da) çekilir ki tohumlu dizi kaymasın
                 agent_indices = list(range(len(self.agents)))
-                random.shuffle(agent_indices)
+                self.rng.shuffle(agent_indices)
+                moderator_comment = self.rng.choice(end_comments)
+                if (step, 'closing') in done:
+                    continue
+                if scheduler is not None:
+                    # Madde açılmadan önce karar verilir: ilk turda her madde en az bir konuşmacıyla,
+                    # ek turlar ancak planlanan kadroyla açılır; kimsenin yanıtlamayacağı giriş yazılmaz
+                    fitting = scheduler.speakers_fitting(plan.speakers)
+                    if fitting < (1 if step < len(plan.items) else plan.speakers):
+                        logger.info(f"Tartışma süresi sonraki madde için yetmiyor, {step} adımda bitiriliyor")
+                        break
+                    agent_indices = agent_indices[:fitting]
+                    if step == len(schedule) - 1:
+                        await self._extend_schedule(schedule, plan, items, scheduler, scheduler.step_cost(fitting),
+                                                    max_rounds)
+                names = [agent.persona.name for agent in self.agents]
+                if step in self._resume_orders:
+                    agent_indices = [names.index(name) for name in self._resume_orders[step] if name in names]
+                else:
+                    await self._journal('order', step=step, speakers=[names[i] for i in agent_indices])
+                next_transition = self._start_transition(step, agent_indices[0], pending) if agent_indices else None
+                
+                # Moderatör girişi (önceki maddenin son konuşmacısı sırasında başlatılmış olabilir)
+                if (step, 'intro') not in done:
+                    if intro_task is None:
+                        intro_task = self._track(self.moderator.start_discussion(agenda_item, first_persona), pending)
+                    moderator_intro = await self._within(intro_task, scheduler)
+                    intro_task = None
+                    first_turn = (step, f"turn:{names[agent_indices[0]]}") if agent_indices else None
+                    if (scheduler is not None and first_turn not in done
+                            and not scheduler.fits(scheduler.speaker_cost())):
+                        # Giriş beklenenden uzun sürdü; ilk konuşmacıya süre kalmadıysa madde açılmaz
+                        logger.info("İlk konuşmacıya süre kalmadı, madde açılmadan bitiriliyor")
+                        break
+                    await self._log_message('Moderatör', moderator_intro, agenda_item, step, 'intro')
+                    
+                    await self.pacing.pause('moderator')
                 
-                for i in agent_indices:
+                for position, i in enumerate(agent_indices):
                     if not self.is_running:
                         break
                     
                     agent = self.agents[i]
+                    speaker = agent.persona.name
+                    if (scheduler is not None and position > 0 and (step, f"turn:{speaker}") not in done
+                            and not scheduler.fits(scheduler.speaker_cost())):
+                        logger.info(f"{speaker} için süre yetmiyor, madde kapatılıyor")
+                        break
+                    
+                    # Moderatör sıradaki kişiye söz versin (geçiş bir önceki persona konuşurken üretildi)
+                    transition_task = next_transition
+                    if transition_task is not None:
+                        moderator_transition = await self._within(transition_task, scheduler)
+                        await self._log_message('Moderatör', moderator_transition, agenda_item, step, f"transition:{speaker}")
                     
-                    # Moderatör sıradaki kişiye söz versin
-                    if i < len(self.agents) - 1:
-                        next_persona = agent.persona.name
-                        moderator_transition = await self.moderator.give_turn(
-                            "önceki konuşmacı", next_persona
-                        )
-                        self.discussion_log.append({
-                            'timestamp': datetime.now(),
-                            'speaker': 'Moderatör',
-                            'message': moderator_transition
-                        })
-                        
-                        if on_new_message:
-                            await on_new_message()
-                        
-                        await asyncio.sleep(2)
+                    # Persona konuşurken bir sonraki bağımsız adımı başlat
+                    if position + 1 < len(agent_indices):
+                        next_transition = self._start_transition(step, agent_indices[position + 1], pending)
+                    else:
+                        next_transition = None
+                        if step + 1 < len(schedule) and (step + 1, 'intro') not in done:
+                            intro_task = self._track(
+                                self.moderator.start_discussion(schedule[step + 1], first_persona), pending
+                            )
+                    
+                    if (step, f"turn:{speaker}") in done:
+                        continue
                     
                     # Persona konuşur
-                    context = self._build_context()
-                    response = await agent.generate_response(context, agenda_item)
-                    self.discussion_log.append({
-                        'timestamp': datetime.now(),
-                        'speaker': agent.persona.name,
-                        'message': response
-                    })
+                    await self.conversation_memory.settle()
+                    context = self._build_context(agenda_item)
                     
-                    if on_new_message:
-                        await on_new_message()
+                    async def on_token(partial_text, speaker=speaker):
+                        self.partial_message = {'speaker': speaker, 'message': partial_text}
                     
-                    await asyncio.sleep(3)
+                    try:
+                        response = await self._within(agent.generate_response(
+                            context, agenda_item, on_token=on_token, discussion_log=self.discussion_log,
+                            transcript_index=self.transcript_index
+                        ), scheduler)
+                    finally:
+                        self.partial_message = None
+                    await self._log_message(speaker, response, agenda_item, step, f"turn:{speaker}")
+                    
+                    await self.pacing.pause('persona')
                 
                 # Tur sonunda moderatör yorum yapsın
-                end_comments = [
-                    "Teşekkürler, bu konuda çok değerli görüşler ortaya çıktı.",
-                    "Farklı bakış açıları ile zengin bir tartışma oldu.",
-                    "Bu konudaki görüşleriniz için hepinize teşekkür ederim."
-                ]
-                moderator_comment = random.choice(end_comments)
-                self.discussion_log.append({
-                    'timestamp': datetime.now(),
-                    'speaker': 'Moderatör',
-                    'message': moderator_comment
-                })
-                
-                if on_new_message:
-                    await on_new_message()
+                # Durdurulan maddenin kapanışı günlüğe yazılmaz; sürdürülünce madde kaldığı yerden devam eder
+                await self._log_message('Moderatör', moderator_comment, agenda_item,
+                                  step if self.is_running else None, 'closing')
                 
-                await asyncio.sleep(2)
-            
-            round_count += 1
+                await self.pacing.pause('moderator')
+                if scheduler is not None and self.is_running and step == len(schedule) - 1:
+                    # Başta sığmayan ek madde/tur, bu madde bittikten sonra sığıyor olabilir
+                    await self._extend_schedule(schedule, plan, items, scheduler, 0.0, max_rounds)
+        except asyncio.TimeoutError:
+            logger.info("Tartışma süresi doldu; süren LLM çağrısı iptal edildi")
+        finally:
+            # Durdurulursa önceden başlatılmış geçiş/giriş çağrıları iptal edilir
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            self._reset_resume_state()
         
+        if self.is_running:
+            await self._journal('finished', messages=len(self.discussion_log))
         self.is_running = False
+        await self.conversation_memory.aclose()
         return self.discussion_log
     
-    def _build_context(self) -> str:
-        """Build conversation context from discussion log"""
-        context_parts = []
-        for entry in self.discussion_log[-5:]:  # Son 5 mesaj
-            context_parts.append(f"{entry['speaker']}: {entry['message']}")
-        return "\n".join(context_parts)
+    async def _extend_schedule(self, schedule: list, plan: DiscussionPlan, items: List[AgendaItem],
+                               scheduler: DeadlineScheduler, remaining_cost: float, max_rounds: int):
+        """Gecikmeler tahminden kısa çıktıysa önce plandan düşen maddeleri, sonra yeni bir turu ekle
+
+        remaining_cost, süren adımın henüz harcanmamış tahmini süresidir (adım bittiyse 0).
+        """
+        dropped = [item for item in items if all(item is not planned for planned in plan.items)]
+        if dropped and len(schedule) == len(plan.items):
+            if scheduler.fits(remaining_cost + scheduler.step_cost(plan.speakers)):
+                plan.items.append(dropped[0])
+                schedule.append(dropped[0])
+                item_indices = {id(item): index for index, item in enumerate(self.agenda_items)}
+                await self._journal('plan', items=[item_indices[id(item)] for item in plan.items])
+            return
+        if len(schedule) // len(plan.items) < max_rounds and scheduler.fits(
+            remaining_cost + len(plan.items) * scheduler.step_cost(plan.speakers)
+        ):
+            plan.rounds += 1
+            schedule.extend(plan.items)
+    
+    @staticmethod
+    async def _within(awaitable, scheduler: Optional[DeadlineScheduler]):
+        """Süre sınırı varsa bekleneni en geç deadline'da iptal et (asyncio.TimeoutError)"""
+        if scheduler is None:
+            return await awaitable
+        return await asyncio.wait_for(awaitable, timeout=max(scheduler.remaining(), 0.0))
+    
+    @staticmethod
+    def _track(coro, pending: set) -> asyncio.Task:
+        """Arka planda başlatılan çağrıyı bekleyenler kümesinde tut; bittiğinde kümeden çıkar"""
+        task = asyncio.create_task(coro)
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        return task
+    
+    def _start_transition(self, step: int, agent_index: int, pending: set) -> Optional[asyncio.Task]:
+        """Listede sonuncu olmayan agent'lar için moderatör geçişini başlat (günlükte olan atlanır)"""
+        if agent_index >= len(self.agents) - 1:
+            return None
+        name = self.agents[agent_index].persona.name
+        if (step, f"transition:{name}") in self._resume_slots:
+            return None
+        return self._track(self.moderator.give_turn("önceki konuşmacı", name), pending)
+    
+    async def _log_message(self, speaker: str, message: str, agenda_item: AgendaItem, step: int = None,
+                           slot: str = None):
+        """Mesajı discussion_log'a ekle, tartışma hafızasına bildir ve günlüğe yaz"""
+        entry = {
+            'timestamp': datetime.now(),
+            'speaker': speaker,
+            'message': message
+        }
+        self.discussion_log.append(entry)
+        self.conversation_memory.observe(entry, agenda_item)
+        self.transcript_index.add(entry)
+        if step is not None:
+            await self._journal('turn', step=step, slot=slot, speaker=speaker, message=message,
+                          timestamp=entry['timestamp'].isoformat())
+        return entry
+    
+    def _build_context(self, agenda_item: AgendaItem = None) -> str:
+        """Build conversation context: rolling summary + recent messages within the token budget"""
+        return self.conversation_memory.build_context(agenda_item)
     
     def stop_simulation(self):
         """Stop the simulation"""
@@ -660,5 +2905,199 @@ class FocusGroupSimulator:
             discussion_parts.append(f"[{timestamp}] {entry['speaker']}: {entry['message']}")
         return "\n".join(discussion_parts)
 
+class SimulationPoolFull(RuntimeError):
+    """Paylaşılan simülasyon havuzunda yer yok ya da oturumun zaten çalışan bir işi var"""
+
+
+@dataclass
+class SimulationJob:
+    """Arka planda çalışan bir oturum simülasyonu; arayüz sadece snapshot() okur"""
+    session_id: str
+    simulator: 'FocusGroupSimulator'
+    status: str = 'running'  # running | completed | stopped | failed
+    phase: str = 'preparation'  # preparation | discussion | done
+    prepared_items: int = 0
+    total_items: int = 0
+    duration_seconds: Optional[float] = None
+    started_at: float = field(default_factory=time.time)
+    discussion_started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    stop_requested: bool = False
+    journal_path: Optional[str] = None
+    future: Optional[Future] = field(default=None, repr=False)
+
+    def snapshot(self) -> dict:
+        now = self.finished_at or time.time()
+        discussion_elapsed = now - self.discussion_started_at if self.discussion_started_at else 0.0
+        return {
+            'status': self.status,
+            'phase': self.phase,
+            'prepared_items': self.prepared_items,
+            'total_items': self.total_items,
+            'messages': len(self.simulator.discussion_log),
+            'partial_message': self.simulator.partial_message,
+            'elapsed': now - self.started_at,
+            'discussion_elapsed': discussion_elapsed,
+            'time_remaining': max(0.0, self.duration_seconds - discussion_elapsed) if self.duration_seconds else None,
+            'stop_requested': self.stop_requested,
+            'error': self.error,
+            'plan': self.simulator.discussion_plan,
+        }
+
+
+class SimulationJobManager:
+    """Oturum simülasyonlarını uzun ömürlü tek bir arka plan event loop'unda çalıştıran iş yöneticisi
+
+    Streamlit betiği iş başlatıp hemen döner; ilerleme simulator.events akışından ve
+    SimulationJob.snapshot() ile okunur. Aynı anda en fazla max_jobs iş kabul edilir
+    (MAX_CONCURRENT_SIMULATIONS); fazlası SimulationPoolFull ile reddedilir. stop() tartışmayı sıradaki LLM çağrısı bitince, hazırlığı hemen durdurur.
+    Biten işler pop_finished() ile son durumları okununca, hiç okunmazsa finished_ttl saniye sonra
+    bırakılır; böylece kapanan oturumların simülatörleri bellekte birikmez. Bir günlüğe aynı anda
+    yalnızca bir bitmemiş iş yazar (active_journals).
+    """
+
+    def __init__(self, max_jobs: int = None, journal_dir: str = None, finished_ttl: float = 900.0):
+        self.max_jobs = max_jobs or int(os.getenv('MAX_CONCURRENT_SIMULATIONS', 2))
+        self.finished_ttl = finished_ttl
+        # Ayarlıysa her iş bir kontrol noktası günlüğü yazar (resume_from_journal ile sürdürülebilir)
+        self.journal_dir = journal_dir or os.getenv('SIMULATION_JOURNAL_DIR')
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, SimulationJob] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # Kilit altında çağrılır
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='simulation-loop', daemon=True)
+            self._thread.start()
+        return self._loop
+
+    def run(self, coro, timeout: float = None):
+        """Bir coroutine'i (ör. arayüzden istenen analiz) işlerin loop'unda çalıştır ve sonucunu bekle
+
+        Anahtar havuzu, token kovaları ve devre kesiciler thread-safe değildir; paylaşılan LLMClient'ı
+        kullanan her çağrı bu yüzden betik thread'inde yeni bir loop açmak yerine bu loop'tan geçer.
+        """
+        with self._lock:
+            loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == 'running')
+
+    def get(self, session_id: str) -> Optional[SimulationJob]:
+        with self._lock:
+            return self._jobs.get(session_id)
+
+    def pop_finished(self, session_id: str) -> Optional[dict]:
+        """İş bittiyse son durumunu döndür ve işi (simülatör referansıyla birlikte) bırak"""
+        with self._lock:
+            job = self._jobs.get(session_id)
+            if job is None or job.finished_at is None:
+                return None
+            del self._jobs[session_id]
+        return job.snapshot()
+
+    def _evict_stale(self):
+        # Kilit altında çağrılır; son durumu hiç okunmayan (kapanmış oturum) işleri bırakır
+        cutoff = time.time() - self.finished_ttl
+        for session_id in [key for key, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[session_id]
+
+    def active_journals(self) -> set:
+        """Bitmemiş işlerin yazdığı günlük dosyaları (mutlak yol)"""
+        with self._lock:
+            return {os.path.abspath(job.journal_path) for job in self._jobs.values()
+                    if job.journal_path and job.finished_at is None}
+
+    def is_busy(self, session_id: str) -> bool:
+        job = self.get(session_id)
+        return job is not None and job.status == 'running'
+
+    def submit(self, session_id: str, simulator: 'FocusGroupSimulator', max_rounds: int = 3,
+               duration_seconds: float = None) -> SimulationJob:
+        """Hazırlık + tartışmayı arka planda başlat ve hemen dön"""
+        with self._lock:
+            self._evict_stale()
+            current = self._jobs.get(session_id)
+            if current is not None and current.status == 'running':
+                raise SimulationPoolFull("Bu oturumda zaten çalışan bir simülasyon var")
+            running = sum(1 for job in self._jobs.values() if job.status == 'running')
+            if running >= self.max_jobs:
+                raise SimulationPoolFull(f"Tüm simülasyon yuvaları dolu ({running}/{self.max_jobs})")
+            job = SimulationJob(session_id=session_id, simulator=simulator,
+                                total_items=len(simulator.agenda_items), duration_seconds=duration_seconds)
+            # Günlüğün sahibi iş kuyruğa girerken belirlenir; sürdürülen günlük zaten yazılıyorsa reddedilir
+            if simulator.journal is not None:
+                job.journal_path = simulator.journal.path
+            elif self.journal_dir:
+                stamp = datetime.fromtimestamp(job.started_at).strftime('%Y%m%d_%H%M%S')
+                job.journal_path = os.path.join(self.journal_dir, f"{stamp}_{session_id[:8]}.jsonl")
+            if job.journal_path and any(
+                other.journal_path and other.finished_at is None
+                and os.path.abspath(other.journal_path) == os.path.abspath(job.journal_path)
+                for other in self._jobs.values()
+            ):
+                raise SimulationPoolFull("Bu günlük başka bir oturumda hâlâ yazılıyor")
+            self._jobs[session_id] = job
+            job.future = asyncio.run_coroutine_threadsafe(self._run(job, max_rounds), self._ensure_loop())
+        return job
+
+    async def _run(self, job: SimulationJob, max_rounds: int):
+        simulator = job.simulator
+
+        async def on_progress(completed_items, total_items, item):
+            job.prepared_items = completed_items
+            job.total_items = total_items
+
+        if simulator.journal is None and job.journal_path:
+            await asyncio.to_thread(simulator.open_journal, job.journal_path)
+        simulator.events.publish('status', status=job.status, phase=job.phase)
+        try:
+            await simulator.prepare_agenda_analysis(on_progress=on_progress)
+            if job.stop_requested:
+                job.status = 'stopped'
+                return
+            job.phase = 'discussion'
+            job.discussion_started_at = time.time()
+            simulator.events.publish('status', status=job.status, phase=job.phase)
+            # Süre sınırını simülatörün zamanlayıcısı uygular: plan, sığmayan konuşmaları atlama, iptal
+            await simulator.start_simulation(max_rounds=max_rounds, duration_seconds=job.duration_seconds)
+            job.status = 'stopped' if job.stop_requested else 'completed'
+        except asyncio.CancelledError:
+            job.status = 'stopped'
+        except Exception as e:
+            logger.error(f"Simulation job failed ({job.session_id}): {e}")
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            await asyncio.to_thread(simulator.close_journal)
+            job.phase = 'done'
+            job.finished_at = time.time()
+            simulator.events.publish('status', status=job.status, phase=job.phase)
+
+    def stop(self, session_id: str) -> bool:
+        job = self.get(session_id)
+        if job is None or job.status != 'running':
+            return False
+        job.stop_requested = True
+        job.simulator.stop_simulation()
+        job.simulator.events.publish('status', status=job.status, phase=job.phase, stop_requested=True)
+        if job.phase == 'preparation' and job.future is not None:
+            job.future.cancel()
+        return True
+
+    def clear(self, session_id: str):
+        """Bitmiş işi unut (sıfırlama için); çalışan iş önce durdurulur"""
+        self.stop(session_id)
+        with self._lock:
+            self._jobs.pop(session_id, None)
+
+
 # Global simulator instance
-simulator = FocusGroupSimulator()
\ No newline at end of file
+simulator = FocusGroupSimulator()
+simulation_jobs = SimulationJobManager()
\ No newline at end of file
@@ -1,34 +1,50 @@
 import os
 import re
 import json
-import asyncio
 import pandas as pd  # BU SATIRI EN BAŞA EKLE (GLOBAL SCOPE)
 import numpy as np
 from datetime import datetime
-import time
 import base64
 import html
 from fpdf import FPDF
 from fpdf.enums import XPos, YPos
 import tempfile
 import random
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 import logging
+import uuid
 from pathlib import Path
 import streamlit as st
 
 # Import simulation components
 try:
-    from main import simulator, FocusGroupSimulator
+    from main import (simulator as shared_simulator, FocusGroupSimulator, fit_analysis_sections,
+                      TranscriptPlayback, simulation_jobs, SimulationPoolFull, list_unfinished_journals)
 except ImportError:
     st.error("⚠️ Ana simülasyon modülleri bulunamadı. main.py dosyasının mevcut olduğundan emin olun.")
     st.stop()
 
-# Global simulation control variables
-SIMULATION_STATE = {
+def get_session_id() -> str:
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+def get_session_simulator() -> FocusGroupSimulator:
+    """Her tarayıcı oturumunun kendi simülatörü; LLM istemcisi (anahtar havuzu, önbellek) tüm oturumlarca paylaşılır"""
+    if 'simulator' not in st.session_state:
+        st.session_state.simulator = FocusGroupSimulator(llm_client=shared_simulator.llm_client)
+    return st.session_state.simulator
+
+# Oturuma özel simülatör ve kontrol durumu
+simulator = get_session_simulator()
+SIMULATION_STATE = st.session_state.setdefault('simulation_state', {
     'running': False,
     'stop_requested': False
-}
+})
+# Çalışıyor bilgisi arka plandaki iş yöneticisinden gelir; betik sadece iş durumunu okur
+SIMULATION_STATE['running'] = simulation_jobs.is_busy(get_session_id())
+# Canlı görünümlerin (sohbet, liste, durum) yenilenme aralığı; sayfanın tamamı yeniden çizilmez
+LIVE_REFRESH_SECONDS = float(os.getenv('LIVE_REFRESH_SECONDS', 1.0))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -164,6 +180,10 @@ def initialize_session_state():
         st.session_state.discussion_duration = 15
     if 'debug_mode' not in st.session_state:
         st.session_state.debug_mode = False
+    if 'playback_speed' not in st.session_state:
+        st.session_state.playback_speed = 1.0
+    if 'playback' not in st.session_state:
+        st.session_state.playback = None
     
     # YENİ EKLEMELER - Analiz ve Rapor için:
     if 'basic_analysis_result' not in st.session_state:
@@ -328,15 +348,68 @@ def clean_html_and_format_text(text):
     
     return text
 
+def playback_pending() -> bool:
+    """Oynatma katmanı henüz tüm mesajları göstermediyse True"""
+    playback = st.session_state.get('playback')
+    return bool(playback and simulator.discussion_log and not playback.is_done(simulator.discussion_log))
+
+def live_fragment(view: str, render: Callable):
+    """render'ı kendi kendini yenileyen bir fragment içinde çalıştır
+
+    Simülasyon sürerken (ya da oynatma bitmemişken) fragment LIVE_REFRESH_SECONDS'ta bir yalnızca
+    kendini baştan çizer; sayfanın geri kalanı dokunulmadan kalır. Oynatma olay üretmediği ve
+    fragment çizmediği öğeleri sildiği için yenileme zamanlayıcıyla yapılır. simulator.events akışı
+    yalnızca işin bittiğini yakalamak için görünümün kendi cursor'ıyla okunur; iş bittiğinde (ya da
+    oynatma tamamlandığında) butonlar ve durum güncellensin diye tüm sayfa bir kez yenilenir.
+    """
+    live = SIMULATION_STATE['running'] or playback_pending()
+    cursor_key = f"event_cursor_{view}"
+
+    def fragment():
+        events, st.session_state[cursor_key] = simulator.events.read(st.session_state.get(cursor_key, 0))
+        finished = SIMULATION_STATE['running'] and any(
+            event.kind == 'status' and event.data.get('phase') == 'done' for event in events
+        )
+        settled = live and not SIMULATION_STATE['running'] and not playback_pending()
+        if finished or settled:
+            st.rerun()
+        render()
+
+    st.fragment(run_every=LIVE_REFRESH_SECONDS if live else None)(fragment)()
+
+def display_chat_panel():
+    """Mesaj sayıları + sohbet görünümü"""
+    if simulator.discussion_log:
+        st.info(f"📊 {len(simulator.discussion_log)} mesaj görüntüleniyor")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("💬 Toplam Mesaj", len(simulator.discussion_log))
+        with col2:
+            persona_msgs = len([m for m in simulator.discussion_log if m['speaker'] != 'Moderatör'])
+            st.metric("👥 Persona Mesajları", persona_msgs)
+        with col3:
+            last_speaker = simulator.discussion_log[-1]['speaker']
+            st.metric("🎤 Son Konuşan", last_speaker)
+    else:
+        st.info("💭 Tartışma henüz başlamadı")
+    
+    display_modern_chat()
+
 def display_modern_chat():
     """Native Streamlit chat - İsim ve moderatör resmi sorunları düzeltildi"""
     if not simulator.discussion_log:
         st.info("💬 Henüz tartışma başlamadı...")
         return
     
+    # Mesajlar hızla üretilir; oynatma katmanı onları seçilen hızda sırayla açar
+    playback = st.session_state.get('playback')
+    visible_log = simulator.discussion_log
+    if playback:
+        visible_log = simulator.discussion_log[:playback.visible_count(simulator.discussion_log)]
+    
     # Sabit yükseklikli container
     with st.container(height=600):
-        for entry in simulator.discussion_log:
+        for entry in visible_log:
             speaker = entry['speaker']
             message = clean_html_and_format_text(entry['message'])
             timestamp = format_message_time(entry['timestamp'])
@@ -390,6 +463,13 @@ def display_modern_chat():
                 if st.session_state.get('debug_mode', False):
                     st.caption(f"Debug: speaker={speaker}, is_mod={is_moderator}, pic_path={pic_path}")
         
+        # Henüz tamamlanmamış (akmakta olan) persona yanıtı
+        partial = simulator.partial_message
+        if partial and partial.get('message') and len(visible_log) == len(simulator.discussion_log):
+            with st.chat_message(partial['speaker']):
+                st.markdown(f"**🗣️ {partial['speaker']}** ✍️")
+                st.markdown(f"💬 {clean_html_and_format_text(partial['message'])}")
+        
         # Auto scroll için JavaScript
         st.markdown("""
         <script>
@@ -445,6 +525,176 @@ def display_conversation_list():
             else:
                 st.write(message)
 
+def display_detailed_list():
+    """Detaylı liste görünümü: istatistikler, filtreler ve CSV dışa aktarma"""
+    if not simulator.discussion_log:
+        st.info("💭 Henüz tartışma başlamadı...")
+    else:
+        # İstatistikler
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("💬 Toplam Mesaj", len(simulator.discussion_log))
+        with col2:
+            persona_messages = len([entry for entry in simulator.discussion_log if entry['speaker'] != 'Moderatör'])
+            st.metric("👥 Persona Mesajları", persona_messages)
+        with col3:
+            moderator_messages = len([entry for entry in simulator.discussion_log if entry['speaker'] == 'Moderatör'])
+            st.metric("🎤 Moderatör Mesajları", moderator_messages)
+        with col4:
+            if len(simulator.discussion_log) > 1:
+                start_time = simulator.discussion_log[0]['timestamp']
+                end_time = simulator.discussion_log[-1]['timestamp']
+                duration = end_time - start_time
+                st.metric("⏱️ Süre", f"{duration.seconds//60}:{duration.seconds%60:02d}")
+            else:
+                st.metric("⏱️ Süre", "0:00")
+        
+        st.markdown("---")
+        
+        # Filtreleme seçenekleri
+        col_filter1, col_filter2 = st.columns(2)
+        with col_filter1:
+            all_speakers = list(set([entry['speaker'] for entry in simulator.discussion_log]))
+            speaker_filter = st.selectbox(
+                "🗣️ Konuşmacı Filtresi:",
+                ["Tümü"] + all_speakers,
+                key="speaker_filter_list"
+            )
+        
+        with col_filter2:
+            show_timestamps = st.checkbox("🕐 Zaman Damgalarını Göster", value=True, key="show_timestamps_list")
+        
+        # Mesajları filtrele
+        filtered_messages = simulator.discussion_log
+        if speaker_filter != "Tümü":
+            filtered_messages = [entry for entry in simulator.discussion_log if entry['speaker'] == speaker_filter]
+        
+        st.markdown(f"### 📝 Mesajlar ({len(filtered_messages)} adet)")
+        
+        # Sayfalama için
+        messages_per_page = 10
+        total_pages = (len(filtered_messages) + messages_per_page - 1) // messages_per_page
+        
+        if total_pages > 1:
+            current_page = st.number_input(
+                f"Sayfa (1-{total_pages}):", 
+                min_value=1, 
+                max_value=total_pages, 
+                value=1, 
+                key="current_page_list"
+            )
+            
+            start_idx = (current_page - 1) * messages_per_page
+            end_idx = start_idx + messages_per_page
+            page_messages = filtered_messages[start_idx:end_idx]
+        else:
+            page_messages = filtered_messages
+            current_page = 1
+        
+        # Mesajları listele
+        for i, entry in enumerate(page_messages, 1):
+            speaker = entry['speaker']
+            message = clean_html_and_format_text(entry['message'])
+            timestamp = format_message_time(entry['timestamp'])
+            
+            if not message or len(message.strip()) == 0:
+                continue
+            
+            # Profil resmi al
+            pic_path = get_persona_pic(speaker)
+            is_moderator = speaker.lower().strip() == 'moderatör'
+            
+            # Global mesaj numarası
+            global_idx = ((current_page - 1) * messages_per_page) + i
+            
+            # Mesaj container'ı
+            with st.container():
+                # Header kısmı
+                col_avatar, col_content = st.columns([1, 8])
+                
+                with col_avatar:
+                    if pic_path and os.path.exists(pic_path):
+                        try:
+                            st.image(pic_path, width=60)
+                        except Exception as e:
+                            avatar_emoji = "🎤" if is_moderator else "👤"
+                            st.markdown(f"<div style='font-size:40px;text-align:center;'>{avatar_emoji}</div>", unsafe_allow_html=True)
+                    else:
+                        avatar_emoji = "🎤" if is_moderator else "👤"
+                        st.markdown(f"<div style='font-size:40px;text-align:center;'>{avatar_emoji}</div>", unsafe_allow_html=True)
+                
+                with col_content:
+                    # İsim ve zaman
+                    header_text = f"**#{global_idx} - {speaker}**"
+                    if show_timestamps:
+                        header_text += f" • *{timestamp}*"
+                    st.markdown(header_text)
+                    
+                    # Mesaj içeriği
+                    if is_moderator:
+                        st.info(f"🎯 {message}")
+                    else:
+                        st.write(f"💬 {message}")
+                    
+                    # Mesaj detayları
+                    col_details1, col_details2 = st.columns(2)
+                    with col_details1:
+                        st.caption(f"📏 {len(message)} karakter")
+                    with col_details2:
+                        st.caption(f"📝 {len(message.split())} kelime")
+                
+                st.markdown("---")
+        
+        # Sayfalama gösterimi
+        if total_pages > 1:
+            st.info(f"📄 Sayfa {current_page} / {total_pages} • Toplam {len(filtered_messages)} mesaj")
+        
+        # Export seçenekleri
+        st.markdown("### 📤 Dışa Aktar")
+        col_export1, col_export2 = st.columns(2)
+        
+        with col_export1:
+            if st.button("📋 Kopyalanabilir Metin", key="copy_text_list"):
+                text_content = ""
+                for idx, entry in enumerate(filtered_messages, 1):
+                    speaker = entry['speaker']
+                    message = clean_html_and_format_text(entry['message'])
+                    timestamp = format_message_time(entry['timestamp'])
+                    text_content += f"[{idx}] [{timestamp}] {speaker}: {message}\n\n"
+                
+                st.text_area("📋 Kopyala:", value=text_content, height=200, key="copyable_text_list")
+        
+        with col_export2:
+            if st.button("💾 CSV İndir", key="download_csv_list"):
+                try:
+                    import io
+                    import csv
+                    
+                    csv_buffer = io.StringIO()
+                    writer = csv.writer(csv_buffer)
+                    writer.writerow(["Sira", "Zaman", "Konusmaci", "Mesaj", "Karakter_Sayisi", "Kelime_Sayisi"])
+                    
+                    for idx, entry in enumerate(filtered_messages, 1):
+                        speaker = entry['speaker']
+                        message = clean_html_and_format_text(entry['message'])
+                        timestamp = entry['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
+                        char_count = len(message)
+                        word_count = len(message.split())
+                        writer.writerow([idx, timestamp, speaker, message, char_count, word_count])
+                    
+                    csv_data = csv_buffer.getvalue()
+                    
+                    st.download_button(
+                        label="📥 CSV Dosyasını İndir",
+                        data=csv_data.encode('utf-8'),
+                        file_name=f'tartisma_listesi_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+                        mime='text/csv',
+                        key="download_csv_button_list"
+                    )
+                    
+                except Exception as e:
+                    st.error(f"CSV oluşturma hatası: {str(e)}")
+
 def display_simulation_tab():
     """Display simulation tab content"""
     st.markdown("### 📁 Gündem Dosyası Yükleme")
@@ -478,7 +728,10 @@ def display_simulation_tab():
             is_valid, message = validate_agenda_file(df)
             
             if is_valid:
-                if simulator.load_agenda_data(file_path):
+                # Dosya her yeniden çalıştırmada değil, yalnızca değiştiğinde yüklenir (puanlar/sürdürülen oturum korunur)
+                file_key = f"{uploaded_file.name}:{uploaded_file.size}"
+                if st.session_state.get('agenda_file_key') == file_key or simulator.load_agenda_data(file_path):
+                    st.session_state.agenda_file_key = file_key
                     st.session_state.agenda_loaded = True
                     st.markdown(f'<div class="success-card">✅ {len(simulator.agenda_items)} gündem maddesi başarıyla yüklendi!</div>', unsafe_allow_html=True)
                     
@@ -495,6 +748,8 @@ def display_simulation_tab():
         except Exception as e:
             st.markdown(f'<div class="error-card">❌ Dosya işleme hatası: {str(e)}</div>', unsafe_allow_html=True)
     
+    display_resume_section()
+    
     # Control buttons
     st.markdown("### 🎮 Simülasyon Kontrolü")
     
@@ -527,6 +782,16 @@ def display_simulation_tab():
         final_duration = custom_duration if custom_duration != discussion_duration else discussion_duration
         st.session_state['discussion_duration'] = final_duration
         st.info(f"Seçilen süre: {final_duration} dakika (~{final_duration//5} tur tartışma)")
+        
+        playback_options = {"Anında": 0.0, "1x": 1.0, "2x": 2.0, "4x": 4.0}
+        playback_label = st.select_slider(
+            "🎭 Oynatma Hızı",
+            options=list(playback_options),
+            value=next((label for label, speed in playback_options.items()
+                        if speed == st.session_state.get('playback_speed', 1.0)), "1x"),
+            help="Tartışma mümkün olan en hızlı şekilde üretilir; sohbet görünümü mesajları bu hızda sırayla gösterir"
+        )
+        st.session_state['playback_speed'] = playback_options[playback_label]
     
     button_col1, button_col2, button_col3 = st.columns(3)
     
@@ -549,111 +814,59 @@ def display_simulation_tab():
         if st.button("🔄 Sıfırla", key="reset_btn"):
             reset_simulation()
     
-    display_simulation_status()
+    live_fragment('status', display_simulation_status)
 
-def start_simulation():
-    """Start simulation synchronously"""
-    try:
-        if not simulator.agenda_items:
-            st.error("❌ Gündem maddesi bulunamadı!")
-            return
-            
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        status_placeholder = st.empty()
-        progress_placeholder = st.empty()
-        
-        status_placeholder.markdown('<div class="info-card">📊 Gündem analizi başlatılıyor...</div>', unsafe_allow_html=True)
-        progress_placeholder.progress(0.1)
-        
-        try:
-            loop.run_until_complete(simulator.prepare_agenda_analysis())
-            status_placeholder.markdown('<div class="success-card">✅ Gündem analizi tamamlandı!</div>', unsafe_allow_html=True)
-            progress_placeholder.progress(0.3)
-            
-            if simulator.agenda_items and any(item.persona_scores for item in simulator.agenda_items):
-                st.markdown("#### 📊 Gündem Puanları Hesaplandı")
-                display_agenda_scores()
-            
-        except Exception as e:
-            status_placeholder.markdown(f'<div class="error-card">❌ Gündem analizi hatası: {str(e)}</div>', unsafe_allow_html=True)
-            SIMULATION_STATE['running'] = False
-            return
-        
-        status_placeholder.markdown('<div class="info-card">💬 Tartışma başlatılıyor...</div>', unsafe_allow_html=True)
-        progress_placeholder.progress(0.5)
-        
-        try:
-            async def run_discussion():
-                discussion_duration_minutes = st.session_state.get('discussion_duration', 5)
-                start_time = time.time()
-                end_time = start_time + (discussion_duration_minutes * 60)
-                
-                message_count = 0
-                
-                status_placeholder.markdown(f'<div class="info-card">💬 {discussion_duration_minutes} dakikalık tartışma başlatılıyor...</div>', unsafe_allow_html=True)
-                
-                async def on_new_message():
-                    nonlocal message_count
-                    message_count += 1
-                    
-                    current_time = time.time()
-                    elapsed_time = current_time - start_time
-                    progress = min(elapsed_time / (discussion_duration_minutes * 60), 1.0)
-                    progress_percentage = 0.5 + (progress * 0.4)
-                    progress_placeholder.progress(progress_percentage)
-                    
-                    time_remaining = max(0, (end_time - current_time) / 60)
-                    status_placeholder.markdown(f'<div class="info-card">💬 Tartışma devam ediyor... Kalan süre: {time_remaining:.1f} dakika</div>', unsafe_allow_html=True)
-                    
-                    if current_time >= end_time:
-                        simulator.stop_simulation()
-                        return
-                    
-                    if SIMULATION_STATE['stop_requested']:
-                        simulator.stop_simulation()
-                        return
-                        
-                    await asyncio.sleep(0.5)
-                
-                await simulator.start_simulation(max_rounds=10, on_new_message=on_new_message)
-            
-            loop.run_until_complete(run_discussion())
-            
-            if SIMULATION_STATE['stop_requested']:
-                status_placeholder.markdown('<div class="info-card">⏹️ Simülasyon kullanıcı tarafından durduruldu</div>', unsafe_allow_html=True)
+def display_resume_section():
+    """Yarım kalmış (durdurulan ya da çöken) oturumları kontrol noktası günlüğünden sürdür"""
+    # Başka oturumların çalışan işlerinin hâlâ yazdığı günlükler listelenmez
+    journals = list_unfinished_journals(simulation_jobs.journal_dir, exclude=simulation_jobs.active_journals())
+    if not journals or SIMULATION_STATE['running']:
+        return
+    
+    with st.expander(f"♻️ Yarım Kalan Oturumlar ({len(journals)})"):
+        journal_path = st.selectbox(
+            "Kontrol noktası günlüğü", journals, format_func=os.path.basename, key="resume_journal",
+            help="Tamamlanan puanlar, hafızalar ve konuşmalar tekrar üretilmez"
+        )
+        if st.button("♻️ Oturumu Sürdür", key="resume_btn"):
+            if simulator.resume_from_journal(journal_path):
+                st.session_state.agenda_loaded = True
+                st.session_state.analysis_result = ""
+                SIMULATION_STATE['running'] = True
+                SIMULATION_STATE['stop_requested'] = False
+                start_simulation()
             else:
-                status_placeholder.markdown('<div class="success-card">✅ Simülasyon başarıyla tamamlandı!</div>', unsafe_allow_html=True)
-            
-            progress_placeholder.progress(1.0)
-            
-        except Exception as e:
-            status_placeholder.markdown(f'<div class="error-card">❌ Tartışma hatası: {str(e)}</div>', unsafe_allow_html=True)
-            logger.error(f"Discussion error: {e}")
-        
-        if simulator.discussion_log:
-            st.info(f"💬 Simülasyon tamamlandı. {len(simulator.discussion_log)} mesaj oluşturuldu.")
-        
+                st.markdown('<div class="error-card">❌ Günlük okunamadı</div>', unsafe_allow_html=True)
+
+def start_simulation():
+    """Start the simulation as a background job and return immediately; progress is read from its snapshot"""
+    if not simulator.agenda_items:
+        st.error("❌ Gündem maddesi bulunamadı!")
         SIMULATION_STATE['running'] = False
-        st.rerun()
-        
-    except Exception as e:
+        return
+    
+    try:
+        simulation_jobs.submit(
+            get_session_id(), simulator, max_rounds=10,
+            duration_seconds=st.session_state.get('discussion_duration', 5) * 60
+        )
+    except SimulationPoolFull as e:
         SIMULATION_STATE['running'] = False
-        st.error(f"Simülasyon genel hatası: {str(e)}")
-        logger.error(f"General simulation error: {e}")
-        
-    finally:
-        try:
-            loop.close()
-        except:
-            pass
+        st.markdown(
+            f'<div class="error-card">⏳ {e}. Şu anda {simulation_jobs.active_count()} simülasyon çalışıyor, '
+            f'lütfen biraz sonra tekrar deneyin.</div>', unsafe_allow_html=True
+        )
+        return
+    
+    st.session_state['last_job_snapshot'] = None
+    st.session_state['playback'] = TranscriptPlayback(speed=st.session_state.get('playback_speed', 1.0))
+    st.rerun()
 
 def stop_simulation():
     """Stop the running simulation"""
     try:
         SIMULATION_STATE['stop_requested'] = True
-        simulator.stop_simulation()
+        simulation_jobs.stop(get_session_id())
         SIMULATION_STATE['running'] = False
         st.warning("⏹️ Simülasyon durduruldu")
         st.rerun()
@@ -662,7 +875,8 @@ def stop_simulation():
 
 def reset_simulation():
     """Reset simulation state"""
-    simulator.stop_simulation()
+    simulation_jobs.clear(get_session_id())
+    st.session_state['last_job_snapshot'] = None
     
     SIMULATION_STATE['running'] = False
     SIMULATION_STATE['stop_requested'] = False
@@ -670,8 +884,10 @@ def reset_simulation():
     st.session_state.analysis_result = ""
     st.session_state.expert_analysis_result = ""
     st.session_state.agenda_loaded = False
+    st.session_state.agenda_file_key = None
     
     simulator.discussion_log = []
+    st.session_state.playback = None
     simulator.mcp_logs = []
     simulator.agenda_items = []
     simulator.memory = {}
@@ -681,11 +897,34 @@ def reset_simulation():
 
 def display_simulation_status():
     """Display simulation status"""
-    if SIMULATION_STATE['running'] or simulator.discussion_log:
+    # Biten iş yöneticiden alınır (simülatör referansı bırakılır); son durumu oturumda saklanır
+    finished = simulation_jobs.pop_finished(get_session_id())
+    if finished is not None:
+        st.session_state['last_job_snapshot'] = finished
+    job = simulation_jobs.get(get_session_id())
+    snapshot = job.snapshot() if job else st.session_state.get('last_job_snapshot')
+    if SIMULATION_STATE['running'] or simulator.discussion_log or snapshot:
         st.markdown("### 📊 Simülasyon Durumu")
         
-        if SIMULATION_STATE['running']:
-            st.markdown('<div class="info-card">🔄 Simülasyon çalışıyor...</div>', unsafe_allow_html=True)
+        if snapshot and snapshot['status'] == 'running':
+            if snapshot['phase'] == 'preparation':
+                total_items = max(snapshot['total_items'], 1)
+                st.progress(0.1 + 0.2 * snapshot['prepared_items'] / total_items)
+                st.markdown(f'<div class="info-card">📊 Gündem analizi: {snapshot["prepared_items"]}/{snapshot["total_items"]} madde tamamlandı...</div>', unsafe_allow_html=True)
+            else:
+                duration = st.session_state.get('discussion_duration', 5) * 60
+                st.progress(0.5 + 0.4 * min(snapshot['discussion_elapsed'] / duration, 1.0))
+                remaining = (snapshot['time_remaining'] or 0) / 60
+                stopping = " (durduruluyor...)" if snapshot['stop_requested'] else ""
+                st.markdown(f'<div class="info-card">💬 Tartışma devam ediyor{stopping}... {snapshot["messages"]} mesaj, kalan süre: {remaining:.1f} dakika</div>', unsafe_allow_html=True)
+                plan = snapshot['plan']
+                if plan:
+                    st.caption(f"🗓️ Plan: {len(plan.items)}/{len(simulator.agenda_items)} madde, {plan.rounds} tur, "
+                               f"madde başına {plan.speakers} konuşmacı (süre doldukça yeniden değerlendirilir)")
+        elif snapshot and snapshot['status'] == 'failed':
+            st.markdown(f'<div class="error-card">❌ Simülasyon hatası: {snapshot["error"]}</div>', unsafe_allow_html=True)
+        elif snapshot and snapshot['status'] == 'stopped':
+            st.markdown(f'<div class="info-card">⏹️ Simülasyon kullanıcı tarafından durduruldu ({snapshot["messages"]} mesaj)</div>', unsafe_allow_html=True)
         elif simulator.discussion_log:
             st.markdown('<div class="success-card">✅ Simülasyon tamamlandı</div>', unsafe_allow_html=True)
         
@@ -789,27 +1028,19 @@ def generate_basic_analysis():
                 message = clean_html_and_format_text(entry['message'])
                 full_discussion += f"[{timestamp}] {speaker}: {message}\n"
             
-            persona_info = ""
-            if simulator.personas:
-                for persona in simulator.personas:
-                    persona_info += f"- {persona.name}: {persona.role}, {persona.personality}\n"
-            
-            agenda_info = ""
-            if simulator.agenda_items:
-                for i, item in enumerate(simulator.agenda_items, 1):
-                    agenda_info += f"{i}. {item.title}\n"
+            fitted = fit_analysis_sections(full_discussion, simulator.personas, simulator.agenda_items)
             
             analysis_prompt = f"""[SİSTEM MESAJI]
 Sen bir "Sosyal Araştırmacı"sın. Sana bir odak grup tartışmasının transkripti verilecek. Temel bir analiz raporu hazırla.
 
 [KATILIMCILAR]
-{persona_info}
+{fitted['personas']}
 
 [TARTIŞILAN KONULAR]
-{agenda_info}
+{fitted['agenda']}
 
 [TARTIŞMA TRANSKRİPTİ]
-{full_discussion}
+{fitted['transcript']}
 
 [TEMEL ANALİZ TALİMATLARI]
 Aşağıdaki başlıkları kullanarak temel bir analiz raporu hazırla:
@@ -833,19 +1064,12 @@ Aşağıdaki başlıkları kullanarak temel bir analiz raporu hazırla:
 Raporunu anlaşılır ve özet bir dille yaz.
 """
             
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            analysis = loop.run_until_complete(simulator.llm_client.call_llm(analysis_prompt))
+            analysis = simulation_jobs.run(simulator.llm_client.call_llm(analysis_prompt, call_type='analysis'))
             st.session_state['analysis_result'] = analysis
             st.success("✅ Temel analiz tamamlandı!")
             st.rerun()
         except Exception as e:
             st.error(f"Analiz oluşturma hatası: {str(e)}")
-        finally:
-            try:
-                loop.close()
-            except:
-                pass
 
 def generate_expert_analysis():
     """Generate expert analysis"""
@@ -858,10 +1082,7 @@ def generate_expert_analysis():
                 message = clean_html_and_format_text(entry['message'])
                 full_discussion += f"[{timestamp}] {speaker}: {message}\n"
             
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            comprehensive_analysis = loop.run_until_complete(simulator.generate_analysis())
+            comprehensive_analysis = simulation_jobs.run(simulator.generate_analysis())
             
             st.session_state.expert_analysis_result = comprehensive_analysis
             st.success("✅ Uzman araştırmacı analizi tamamlandı!")
@@ -869,11 +1090,6 @@ def generate_expert_analysis():
             
         except Exception as e:
             st.error(f"Araştırma analizi oluşturma hatası: {str(e)}")
-        finally:
-            try:
-                loop.close()
-            except:
-                pass
 
 def display_report_tab():
     """Display report tab content"""
@@ -1143,6 +1359,29 @@ def main():
             with col2:
                 st.metric("Başarılı", stats['successful_requests'])
                 st.metric("Başarısız", stats['failed_requests'])
+            open_keys = sum(1 for state in stats['key_states'].values() if state == 'open')
+            st.caption(f"🔑 Aktif API anahtarı: {stats['api_key_count'] - open_keys}/{stats['api_key_count']}")
+            parse_failures = sum(counts['failed'] for counts in stats['parse'].values())
+            if parse_failures:
+                st.caption(f"⚠️ Ayrıştırılamayan yapılandırılmış yanıt: {parse_failures}")
+            st.caption(f"🗄️ Önbellek isabeti: {stats['cache']['hit_rate']:.1f}% ({stats['cache']['hits']}/{stats['cache']['hits'] + stats['cache']['misses']})")
+            
+            if stats['latency_by_type']:
+                with st.expander("⏱️ Gecikme ve Token"):
+                    st.caption(f"Token/dakika (son 60 sn): {stats['tokens_per_minute']:.0f}")
+                    latency_rows = [
+                        {
+                            'Tür': call_type,
+                            'Çağrı': values['calls'],
+                            'p50 (sn)': round(values['p50'], 2),
+                            'p95 (sn)': round(values['p95'], 2),
+                            'p99 (sn)': round(values['p99'], 2),
+                            'Kuyruk (sn)': round(values['mean_queue_wait'], 2),
+                            'Tekrar': values['retries'],
+                        }
+                        for call_type, values in stats['latency_by_type'].items()
+                    ]
+                    st.dataframe(pd.DataFrame(latency_rows), hide_index=True)
     
     # Main content tabs
     # Main content tabs - Chat görünümü için güncelleme
@@ -1158,31 +1397,10 @@ def main():
         if 'debug_mode' not in st.session_state:
             st.session_state['debug_mode'] = False
         
-        col_debug, col_info = st.columns([1, 3])
-        with col_debug:
-            debug_mode = st.checkbox("🔍 Debug Mode", value=st.session_state['debug_mode'], key="debug_mode_checkbox")
-            # Session state'i güncelle
-            if debug_mode != st.session_state['debug_mode']:
-                st.session_state['debug_mode'] = debug_mode
-        
-        with col_info:
-            if simulator.discussion_log:
-                st.info(f"📊 {len(simulator.discussion_log)} mesaj görüntüleniyor")
-            else:
-                st.info("💭 Tartışma henüz başlamadı")
-        
-        # Chat bilgi paneli
-        if simulator.discussion_log:
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("💬 Toplam Mesaj", len(simulator.discussion_log))
-            with col2:
-                persona_msgs = len([m for m in simulator.discussion_log if m['speaker'] != 'Moderatör'])
-                st.metric("👥 Persona Mesajları", persona_msgs)
-            with col3:
-                if simulator.discussion_log:
-                    last_speaker = simulator.discussion_log[-1]['speaker']
-                    st.metric("🎤 Son Konuşan", last_speaker)
+        debug_mode = st.checkbox("🔍 Debug Mode", value=st.session_state['debug_mode'], key="debug_mode_checkbox")
+        # Session state'i güncelle
+        if debug_mode != st.session_state['debug_mode']:
+            st.session_state['debug_mode'] = debug_mode
         
         # Debug bilgileri
         if st.session_state.get('debug_mode', False):
@@ -1198,14 +1416,8 @@ def main():
                 mod_status = "✅ Var" if mod_pic and os.path.exists(mod_pic) else "❌ Yok"
                 st.text(f"Moderatör: {mod_status} ({mod_pic})")
         
-        # Chat görünümünü göster
-        display_modern_chat()
-        
-        # Otomatik yenileme kontrolü
-        if SIMULATION_STATE['running']:
-            with st.spinner("💬 Yeni mesajlar bekleniyor..."):
-                time.sleep(2)
-                st.rerun()
+        # Chat görünümünü göster (yeni olay geldikçe sadece bu bölüm yenilenir)
+        live_fragment('chat', display_chat_panel)
         
         # Manuel yenileme butonu
         if st.button("🔄 Chat'i Yenile", key="refresh_chat"):
@@ -1214,178 +1426,7 @@ def main():
     with main_tabs[2]:  # Liste Görünümü
         st.markdown("### 📋 Detaylı Liste Görünümü")
         
-        if not simulator.discussion_log:
-            st.info("💭 Henüz tartışma başlamadı...")
-        else:
-            # İstatistikler
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.metric("💬 Toplam Mesaj", len(simulator.discussion_log))
-            with col2:
-                persona_messages = len([entry for entry in simulator.discussion_log if entry['speaker'] != 'Moderatör'])
-                st.metric("👥 Persona Mesajları", persona_messages)
-            with col3:
-                moderator_messages = len([entry for entry in simulator.discussion_log if entry['speaker'] == 'Moderatör'])
-                st.metric("🎤 Moderatör Mesajları", moderator_messages)
-            with col4:
-                if len(simulator.discussion_log) > 1:
-                    start_time = simulator.discussion_log[0]['timestamp']
-                    end_time = simulator.discussion_log[-1]['timestamp']
-                    duration = end_time - start_time
-                    st.metric("⏱️ Süre", f"{duration.seconds//60}:{duration.seconds%60:02d}")
-                else:
-                    st.metric("⏱️ Süre", "0:00")
-            
-            st.markdown("---")
-            
-            # Filtreleme seçenekleri
-            col_filter1, col_filter2 = st.columns(2)
-            with col_filter1:
-                all_speakers = list(set([entry['speaker'] for entry in simulator.discussion_log]))
-                speaker_filter = st.selectbox(
-                    "🗣️ Konuşmacı Filtresi:",
-                    ["Tümü"] + all_speakers,
-                    key="speaker_filter_list"
-                )
-            
-            with col_filter2:
-                show_timestamps = st.checkbox("🕐 Zaman Damgalarını Göster", value=True, key="show_timestamps_list")
-            
-            # Mesajları filtrele
-            filtered_messages = simulator.discussion_log
-            if speaker_filter != "Tümü":
-                filtered_messages = [entry for entry in simulator.discussion_log if entry['speaker'] == speaker_filter]
-            
-            st.markdown(f"### 📝 Mesajlar ({len(filtered_messages)} adet)")
-            
-            # Sayfalama için
-            messages_per_page = 10
-            total_pages = (len(filtered_messages) + messages_per_page - 1) // messages_per_page
-            
-            if total_pages > 1:
-                current_page = st.number_input(
-                    f"Sayfa (1-{total_pages}):", 
-                    min_value=1, 
-                    max_value=total_pages, 
-                    value=1, 
-                    key="current_page_list"
-                )
-                
-                start_idx = (current_page - 1) * messages_per_page
-                end_idx = start_idx + messages_per_page
-                page_messages = filtered_messages[start_idx:end_idx]
-            else:
-                page_messages = filtered_messages
-                current_page = 1
-            
-            # Mesajları listele
-            for i, entry in enumerate(page_messages, 1):
-                speaker = entry['speaker']
-                message = clean_html_and_format_text(entry['message'])
-                timestamp = format_message_time(entry['timestamp'])
-                
-                if not message or len(message.strip()) == 0:
-                    continue
-                
-                # Profil resmi al
-                pic_path = get_persona_pic(speaker)
-                is_moderator = speaker.lower().strip() == 'moderatör'
-                
-                # Global mesaj numarası
-                global_idx = ((current_page - 1) * messages_per_page) + i
-                
-                # Mesaj container'ı
-                with st.container():
-                    # Header kısmı
-                    col_avatar, col_content = st.columns([1, 8])
-                    
-                    with col_avatar:
-                        if pic_path and os.path.exists(pic_path):
-                            try:
-                                st.image(pic_path, width=60)
-                            except Exception as e:
-                                avatar_emoji = "🎤" if is_moderator else "👤"
-                                st.markdown(f"<div style='font-size:40px;text-align:center;'>{avatar_emoji}</div>", unsafe_allow_html=True)
-                        else:
-                            avatar_emoji = "🎤" if is_moderator else "👤"
-                            st.markdown(f"<div style='font-size:40px;text-align:center;'>{avatar_emoji}</div>", unsafe_allow_html=True)
-                    
-                    with col_content:
-                        # İsim ve zaman
-                        header_text = f"**#{global_idx} - {speaker}**"
-                        if show_timestamps:
-                            header_text += f" • *{timestamp}*"
-                        st.markdown(header_text)
-                        
-                        # Mesaj içeriği
-                        if is_moderator:
-                            st.info(f"🎯 {message}")
-                        else:
-                            st.write(f"💬 {message}")
-                        
-                        # Mesaj detayları
-                        col_details1, col_details2 = st.columns(2)
-                        with col_details1:
-                            st.caption(f"📏 {len(message)} karakter")
-                        with col_details2:
-                            st.caption(f"📝 {len(message.split())} kelime")
-                    
-                    st.markdown("---")
-            
-            # Sayfalama gösterimi
-            if total_pages > 1:
-                st.info(f"📄 Sayfa {current_page} / {total_pages} • Toplam {len(filtered_messages)} mesaj")
-            
-            # Export seçenekleri
-            st.markdown("### 📤 Dışa Aktar")
-            col_export1, col_export2 = st.columns(2)
-            
-            with col_export1:
-                if st.button("📋 Kopyalanabilir Metin", key="copy_text_list"):
-                    text_content = ""
-                    for idx, entry in enumerate(filtered_messages, 1):
-                        speaker = entry['speaker']
-                        message = clean_html_and_format_text(entry['message'])
-                        timestamp = format_message_time(entry['timestamp'])
-                        text_content += f"[{idx}] [{timestamp}] {speaker}: {message}\n\n"
-                    
-                    st.text_area("📋 Kopyala:", value=text_content, height=200, key="copyable_text_list")
-            
-            with col_export2:
-                if st.button("💾 CSV İndir", key="download_csv_list"):
-                    try:
-                        import io
-                        import csv
-                        
-                        csv_buffer = io.StringIO()
-                        writer = csv.writer(csv_buffer)
-                        writer.writerow(["Sira", "Zaman", "Konusmaci", "Mesaj", "Karakter_Sayisi", "Kelime_Sayisi"])
-                        
-                        for idx, entry in enumerate(filtered_messages, 1):
-                            speaker = entry['speaker']
-                            message = clean_html_and_format_text(entry['message'])
-                            timestamp = entry['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-                            char_count = len(message)
-                            word_count = len(message.split())
-                            writer.writerow([idx, timestamp, speaker, message, char_count, word_count])
-                        
-                        csv_data = csv_buffer.getvalue()
-                        
-                        st.download_button(
-                            label="📥 CSV Dosyasını İndir",
-                            data=csv_data.encode('utf-8'),
-                            file_name=f'tartisma_listesi_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-                            mime='text/csv',
-                            key="download_csv_button_list"
-                        )
-                        
-                    except Exception as e:
-                        st.error(f"CSV oluşturma hatası: {str(e)}")
-        
-        # Otomatik yenileme
-        if SIMULATION_STATE['running']:
-            time.sleep(3)
-            st.rerun()        
+        live_fragment('list', display_detailed_list)
 
     with main_tabs[3]:  # Analiz
         st.markdown("### 📊 Tartışma Analizi")
@@ -1527,39 +1568,24 @@ TARTIŞMA:
 
 Maksimum 500 kelime ile analiz et."""
 
-                                loop = asyncio.new_event_loop()
-                                asyncio.set_event_loop(loop)
-                                analysis = loop.run_until_complete(simulator.llm_client.call_llm(analysis_prompt))
+                                analysis = simulation_jobs.run(simulator.llm_client.call_llm(analysis_prompt, call_type='analysis'))
                                 
                                 st.session_state['basic_analysis_result'] = analysis
                                 st.success("✅ Temel analiz tamamlandı!")
                                 
                             except Exception as e:
                                 st.error(f"❌ Analiz hatası: {str(e)}")
-                            finally:
-                                try:
-                                    loop.close()
-                                except:
-                                    pass
                 
                 with col_expert:
                     if st.button("🎓 Uzman Analizi", key="expert_ai_analysis"):
                         with st.spinner("🔬 Uzman araştırmacı analiz ediyor..."):
                             try:
-                                loop = asyncio.new_event_loop()
-                                asyncio.set_event_loop(loop)
-                                
-                                comprehensive_analysis = loop.run_until_complete(simulator.generate_analysis())
+                                comprehensive_analysis = simulation_jobs.run(simulator.generate_analysis())
                                 st.session_state['expert_analysis_result'] = comprehensive_analysis
                                 st.success("✅ Uzman analizi tamamlandı!")
                                 
                             except Exception as e:
                                 st.error(f"❌ Uzman analiz hatası: {str(e)}")
-                            finally:
-                                try:
-                                    loop.close()
-                                except:
-                                    pass
                 
                 # Analiz sonuçlarını göster
                 if st.session_state.get('basic_analysis_result'):
@@ -0,0 +1,37 @@
+import asyncio
+import os
+
+os.environ.setdefault('LLM_PROVIDER', 'fake')
+
+from main import FakeProvider, GeminiProvider, LLMClient, LLMResult  # noqa: E402
+
+
+class StubGeminiProvider(GeminiProvider):
+    """GeminiProvider whose network call is replaced by a fixed reply"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def generate(self, api_key, prompt, model_name, generation_config):
+        self.calls += 1
+        return LLMResult(text='gerçek gemini yanıtı')
+
+
+def test_fake_replies_are_not_served_to_gemini(tmp_path, monkeypatch):
+    monkeypatch.setenv('LLM_CACHE_PATH', str(tmp_path / 'llm_cache.sqlite3'))
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    prompt = 'Bu görüşü 1-10 arası puanla'
+
+    fake_client = LLMClient(provider=FakeProvider(latency_median=0.0, latency_sigma=0.0))
+    fake_reply = asyncio.run(fake_client.call_llm(prompt, call_type='score'))
+
+    gemini = StubGeminiProvider()
+    gemini_client = LLMClient(provider=gemini)
+    first = asyncio.run(gemini_client.call_llm(prompt, call_type='score'))
+    second = asyncio.run(gemini_client.call_llm(prompt, call_type='score'))
+
+    assert first == second == 'gerçek gemini yanıtı'
+    assert first != fake_reply
+    # İkinci çağrı Gemini'nin kendi önbellek kaydından döner
+    assert gemini.calls == 1